@@ -2,16 +2,58 @@
 A Reddit bot that replies to unread messages with newly generated markov chains.
 """
 
+import os
 import pickle
-import random
+import time
 
 import praw
 import config
+from cache import LRUCache
+from markov import IGNORED_PREFIX_PATTERNS, MarkovChain
+from pool import ReplyPool
+from scheduler import ReplyScheduler
 
 
 MODEL_FILE = "./model.pickle"
 COMMENTS_LOG = "./processed_comments.txt"
 
+# The order (memory length in words) of the model, this must match the order number in step2.py
+ORDER = 2
+
+# The number of comments generated for each reply, only the best scored one is posted.
+NUMBER_OF_CANDIDATES = 5
+
+# The number of contexts whose ranked prefixes are cached and for how many seconds (None never expires).
+# A single run only keeps them until it exits, they last longer with RUN_FOREVER.
+CONTEXT_CACHE_SIZE = 1000
+CONTEXT_CACHE_TTL = 3600
+
+# Reuse the unposted candidates when the same context arrives again.
+CACHE_REPLIES = False
+
+# Keep running and check the inbox every CHECK_INTERVAL seconds instead of exiting after one check.
+# The model is loaded once and again only when the model file changes.
+RUN_FOREVER = False
+CHECK_INTERVAL = 60
+
+# Keep a pool of pre-generated comments for each top context keyword, refilled between inbox checks.
+# It is only used with RUN_FOREVER, a single run exits before the pool has anything to offer.
+USE_REPLY_POOL = False
+REPLY_POOL_BUCKET_SIZE = 5
+REPLY_POOL_MAX_BUCKETS = 50
+
+# The number of seconds the pool worker waits after generating each comment.
+REPLY_POOL_REFILL_INTERVAL = 0.1
+
+# The number of times a failed reply is retried and the seconds to wait after the first failure.
+REPLY_MAX_RETRIES = 3
+REPLY_BACKOFF = 5
+
+# The maximum seconds a run spends replying, keep it below the time between runs minus the time
+# it takes to load the model, so runs don't overlap and reply twice to the same comments.
+# What's left is replied in the next run.
+MAX_RUN_TIME = 40
+
 # These users will be ignored to avoid errors and infinite replies.
 IGNORED_USERS = ["HuachiBot", "reddit", "AutoModerator", None]
 
@@ -82,209 +124,232 @@ def update_log(comment_id):
         log_file.write("{}\n".format(comment_id))
 
 
-def init():
-    """Inits the bot by fetching the inbox and replying with newly generated comments."""
+def get_pending_comments(reddit):
+    """Returns the inbox comments we haven't replied to yet.
 
-    # Complete our stop words set.
-    add_extra_words()
-
-    # Load the model and remove prefixes that are commonly used by other bots.
-    model = read_model(MODEL_FILE)
+    Parameters
+    ----------
+    reddit : praw.Reddit
+        The logged in Reddit instance.
 
-    for key in list(model.keys()):
-        if "^#" in key or "|" in key or "*****" in key or "^^" in key:
-            del model[key]
+    Returns
+    -------
+    list
+        The pending Reddit comments.
 
-    # We start the Reddit bot.
-    reddit = praw.Reddit(client_id=config.APP_ID, client_secret=config.APP_SECRET,
-                         user_agent=config.USER_AGENT, username=config.REDDIT_USERNAME,
-                         password=config.REDDIT_PASSWORD)
+    """
 
     processed_comments = load_log()
 
-    for comment in reddit.inbox.all(limit=100):
-
-        if comment.author not in IGNORED_USERS and comment.id not in processed_comments:
-
-            new_comment = generate_comment(model=model, order=2,
-                                           number_of_sentences=2,
-                                           initial_prefix=get_prefix_with_context(model, comment.body))
-
-            # Small clean up when the bot uses Markdown and making sure the first letter is uppercase.
-            new_comment = new_comment.replace(
-                " > ", "\n\n > ").replace(" * ", "\n\n* ")
-
-            new_comment = new_comment[0].upper() + new_comment[1:]
-
-            if "[" not in new_comment and "]" in new_comment:
-                new_comment = "[" + new_comment
+    return [comment for comment in reddit.inbox.all(limit=100)
+            if comment.author not in IGNORED_USERS and comment.id not in processed_comments]
 
-            new_comment = new_comment.replace("U/", "u/").replace("R/", "r/")
 
-            comment.reply(new_comment)
-            update_log(comment.id)
-            print("Replied to:", comment.id)
-
-
-def read_model(file_name):
-    """Loads the specified pickle file.
+def load_chain(cache):
+    """Loads the model and builds its sampling tables.
 
     Parameters
     ----------
-    file_name : str
-        The location the pickle file.
+    cache : cache.LRUCache
+        The cache of the ranked prefixes, it is cleared when a new model is loaded.
 
     Returns
     -------
-    dict
-        The dictionary inside the pickle.
+    markov.MarkovChain
+        The chain used for every reply.
 
     """
 
-    with open(file_name, "rb") as model_file:
-        return pickle.load(model_file)
+    # The prefixes commonly used by other bots are left out, in case the model was trained without removing them.
+    return MarkovChain(read_model(MODEL_FILE), order=ORDER, cache=cache,
+                       cache_replies=CACHE_REPLIES, ignored_patterns=IGNORED_PREFIX_PATTERNS)
 
 
-def get_prefix(model_keys):
-    """Get a random prefix that starts in uppercase.
+def reply_to_comments(reddit, chain, pending_comments, reply_pool=None):
+    """Replies to the pending comments with newly generated comments.
 
     Parameters
     ----------
-    model_keys : list
-        A list containing all the model keys.
+    reddit : praw.Reddit
+        The logged in Reddit instance.
 
-    Returns
-    -------
-    str
-        The randomly selected prefix.
+    chain : markov.MarkovChain
+        The chain used to generate the replies.
+
+    pending_comments : list
+        The Reddit comments to reply to.
+
+    reply_pool : pool.ReplyPool
+        An optional pool of pre-generated comments.
 
     """
 
-    # We give it a maximum of 10,000 tries.
-    for _ in range(10000):
+    def generate_reply(comment):
+
+        new_comment = None
 
-        random_prefix = random.choice(model_keys)
+        if reply_pool is not None:
+            new_comment = reply_pool.get_reply(comment.body)
 
-        if random_prefix[0].isupper():
+        # On a pool miss we generate the comment inline.
+        if new_comment is None:
+            new_comment = chain.generate_best_comment(number_of_sentences=2,
+                                                      context=comment.body,
+                                                      stop_words=STOP_WORDS,
+                                                      number_of_candidates=NUMBER_OF_CANDIDATES)
 
-            ends_with_punctuation = False
-            stripped_suffix = random_prefix.strip()
+        return clean_comment(new_comment)
 
-            for char in [".", "?", "!"]:
-                if stripped_suffix[-1] == char:
-                    ends_with_punctuation = True
-                    break
+    def on_success(comment):
 
-            if not ends_with_punctuation:
-                break
+        update_log(comment.id)
+        print("Replied to:", comment.id)
 
-    return random_prefix
+    def on_rejected(comment):
 
+        # Deleted comments or locked threads will never accept a reply, we don't try them again.
+        update_log(comment.id)
 
-def get_prefix_with_context(model, context):
-    """Get a random prefix that matches the given context.
+    # Replies are generated in a background thread while the previous ones are posted.
+    scheduler = ReplyScheduler(generate_reply=generate_reply,
+                               get_limits=lambda: reddit.auth.limits,
+                               on_success=on_success,
+                               on_rejected=on_rejected,
+                               max_retries=REPLY_MAX_RETRIES,
+                               backoff=REPLY_BACKOFF,
+                               max_run_time=MAX_RUN_TIME)
+
+    scheduler.run(pending_comments)
+
+
+def run_forever(reddit):
+    """Checks the inbox every CHECK_INTERVAL seconds, keeping the model, its cache and the reply pool loaded.
+
+    The model is loaded again when its file changes, which also empties the cache and the pool.
 
     Parameters
     ----------
-    model : dict
-        The dictionary containing all the pairs and their possible outcomes.
+    reddit : praw.Reddit
+        The logged in Reddit instance.
 
-    context : str
-        A sentence which will be separated into keywords.
+    """
 
-    Returns
-    -------
-    str
-        The randomly selected context-aware prefix.
+    cache = LRUCache(max_size=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL)
+    chain = None
+    model_time = None
+    reply_pool = None
 
-    """
+    try:
+        while True:
 
-    model_keys = list(model.keys())
+            if os.path.getmtime(MODEL_FILE) != model_time:
 
-    # Some light cleanup.
-    context = context.replace("?", "").replace("!", "").replace(".", "")
-    context_keywords = list(set(context.split()))
+                model_time = os.path.getmtime(MODEL_FILE)
+                chain = load_chain(cache)
+                print("Loaded the model from:", MODEL_FILE)
 
-    # We remove stop words from the context.
-    # We use reversed() to remove items from the list without affecting the sequence.
-    for word in reversed(context_keywords):
+                # The pooled comments came from the previous model.
+                if reply_pool is not None:
+                    reply_pool.stop()
+                    reply_pool = None
 
-        if len(word) <= 3 or word in STOP_WORDS:
-            context_keywords.remove(word)
+                if USE_REPLY_POOL:
+                    reply_pool = ReplyPool(chain, STOP_WORDS, number_of_sentences=2,
+                                           number_of_candidates=NUMBER_OF_CANDIDATES,
+                                           bucket_size=REPLY_POOL_BUCKET_SIZE,
+                                           max_buckets=REPLY_POOL_MAX_BUCKETS,
+                                           refill_interval=REPLY_POOL_REFILL_INTERVAL)
+                    reply_pool.start()
 
-    # If our context has no keywords left we return a random prefix.
-    if len(context_keywords) == 0:
-        return get_prefix(model_keys)
+            pending_comments = get_pending_comments(reddit)
 
-    # We are going to sample one prefix for each available keyword and return only one.
-    random.shuffle(model_keys)
-    sampled_prefixes = list()
+            if len(pending_comments) > 0:
 
-    for word in context_keywords:
+                # The worker waits while we reply and refills the requested buckets until the next check.
+                if reply_pool is not None:
+                    reply_pool.pause()
 
-        for prefix in model_keys:
+                reply_to_comments(reddit, chain, pending_comments, reply_pool)
 
-            if word in prefix or word.lower() in prefix or word.title() in prefix:
-                sampled_prefixes.append(prefix)
-                break
+                if reply_pool is not None:
+                    reply_pool.resume()
 
-    # If we don't get any samples we fallback to the random prefix method.
-    if len(sampled_prefixes) == 0:
-        return get_prefix(model_keys)
-    else:
-        return random.choice(sampled_prefixes)
+            time.sleep(CHECK_INTERVAL)
 
+    finally:
+        if reply_pool is not None:
+            reply_pool.stop()
 
-def generate_comment(model, number_of_sentences, initial_prefix, order):
-    """Generates a new comment using the model and an initial prefix.
 
-    Parameters
-    ----------
-    model : dict
-        The dictionary containing all the pairs and their possible outcomes.
+def init():
+    """Inits the bot by fetching the inbox and replying with newly generated comments."""
+
+    # Complete our stop words set.
+    add_extra_words()
+
+    # We start the Reddit bot.
+    reddit = praw.Reddit(client_id=config.APP_ID, client_secret=config.APP_SECRET,
+                         user_agent=config.USER_AGENT, username=config.REDDIT_USERNAME,
+                         password=config.REDDIT_PASSWORD)
 
-    number_of_Sentences : int
-        The maximum number of sentences.
+    if RUN_FOREVER:
+        run_forever(reddit)
+        return
 
-    initial_prefix : str
-        The word(s) that will start the chain.
+    pending_comments = get_pending_comments(reddit)
 
-    order : int
-        The number of words in the state, this must match the order number in step2.py
+    # Loading the model is the slowest part of a run, we skip it when there is nothing to reply to.
+    if len(pending_comments) == 0:
+        return
+
+    # The cache only lives for this run, it still helps when the same mention arrives several times.
+    reply_to_comments(reddit, load_chain(LRUCache(max_size=CONTEXT_CACHE_SIZE, ttl=CONTEXT_CACHE_TTL)),
+                      pending_comments)
+
+
+def clean_comment(new_comment):
+    """Small clean up when the bot uses Markdown and making sure the first letter is uppercase.
+
+    Parameters
+    ----------
+    new_comment : str
+        The generated comment.
 
     Returns
     -------
     str
-        The newly generated text.
+        The comment ready to be posted.
 
     """
 
-    counter = 0
-    model_keys = list(model.keys())
-    latest_suffix = initial_prefix
-    final_sentence = latest_suffix + " "
+    new_comment = new_comment.replace(
+        " > ", "\n\n > ").replace(" * ", "\n\n* ")
 
-    # We add a maximum sentence length to avoid going infinite in edge cases.
-    for _ in range(500):
+    new_comment = new_comment[0].upper() + new_comment[1:]
 
-        try:
-            latest_suffix = random.choice(model[latest_suffix])
-        except:
-            # If we don't get another word we take another one randomly and continue the chain.
-            latest_suffix = get_prefix(model_keys)
+    if "[" not in new_comment and "]" in new_comment:
+        new_comment = "[" + new_comment
+
+    return new_comment.replace("U/", "u/").replace("R/", "r/")
+
+
+def read_model(file_name):
+    """Loads the specified pickle file.
 
-        final_sentence += latest_suffix + " "
-        latest_suffix = " ".join(final_sentence.split()[-order:]).strip()
+    Parameters
+    ----------
+    file_name : str
+        The location the pickle file.
 
-        for char in [".", "?", "!"]:
-            if latest_suffix[-1] == char:
-                counter += 1
-                break
+    Returns
+    -------
+    dict
+        The dictionary inside the pickle.
 
-        if counter >= number_of_sentences:
-            break
+    """
 
-    return final_sentence
+    with open(file_name, "rb") as model_file:
+        return pickle.load(model_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+"""
+A small LRU cache with optional expiration, used to skip the context search for
+contexts the bot has already seen.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Keeps the most recently used entries and evicts the oldest ones.
+
+    All entries belong to a model version, when a different version is bound
+    the cache clears itself so we never reuse prefixes from an older model.
+    It can be shared with the reply pool worker thread.
+
+    Parameters
+    ----------
+    max_size : int
+        The maximum number of entries, the least recently used one is evicted first.
+
+    ttl : float
+        The number of seconds an entry is valid. None keeps them until evicted.
+
+    """
+
+    def __init__(self, max_size, ttl=None):
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def bind(self, version):
+        """Clears the cache if the given model version is not the current one.
+
+        Parameters
+        ----------
+        version : int
+            The version of the model that will use this cache.
+
+        """
+
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def get(self, key):
+        """Returns the value of the given key and marks it as recently used.
+
+        Parameters
+        ----------
+        key : hashable
+            The key of the entry.
+
+        Returns
+        -------
+        object
+            The cached value or None if it is missing or expired.
+
+        """
+
+        with self._lock:
+
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Adds or replaces an entry and evicts the least recently used ones.
+
+        Parameters
+        ----------
+        key : hashable
+            The key of the entry.
+
+        value : object
+            The value to store.
+
+        """
+
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+
+        with self._lock:
+
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes all entries."""
+
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,1025 @@
+"""
+The Markov chain engine shared by bot.py and step3.py.
+
+The training model maps each prefix to a list with every suffix that followed it,
+repeated words included. Here we convert the words to ids and collapse those lists
+into alias tables so picking the next word takes constant time no matter how many
+outcomes a prefix has. Words are only joined into strings when a comment is returned.
+"""
+
+import heapq
+import itertools
+import math
+import random
+import re
+import string
+from collections import Counter
+
+from vocabulary import Vocabulary
+
+
+# These characters mark the end of a sentence.
+SENTENCE_ENDINGS = (".", "?", "!")
+
+# We add a maximum sentence length to avoid going infinite in edge cases.
+MAX_STEPS = 500
+
+# Common keywords can match thousands of prefixes, we only score a random sample of them.
+MAX_CANDIDATES_PER_KEYWORD = 2000
+
+# The number of best scored prefixes we randomly choose the seed from.
+CONTEXT_TOP_K = 10
+
+# Prefixes that contain any of these are commonly used by other bots.
+IGNORED_PREFIX_PATTERNS = ["^#", "|", "*****", "^^"]
+
+# Every MarkovChain gets a new version so caches can tell models apart.
+_MODEL_VERSIONS = itertools.count()
+
+# The weights used to score candidate comments, see score_candidate().
+IDEAL_COMMENT_LENGTH = 25
+KEYWORD_COVERAGE_WEIGHT = 2.0
+RESTART_PENALTY = 0.5
+UNFINISHED_PENALTY = 1.0
+
+
+def build_alias_table(suffixes):
+    """Creates an alias table from a list of suffixes using Vose's method.
+
+    Parameters
+    ----------
+    suffixes : list
+        All the outcomes of a prefix, an outcome that appears twice is twice as likely.
+
+    Returns
+    -------
+    tuple
+        The unique words, the probability of keeping each column and the column
+        we jump to otherwise. Prefixes with only one outcome don't need the last two.
+
+    """
+
+    counts = Counter(suffixes)
+    words = list(counts.keys())
+
+    if len(words) == 1:
+        return (words, None, None)
+
+    total = len(suffixes)
+    columns = len(words)
+
+    # Each column starts with its probability scaled so the average is 1.
+    probabilities = [counts[word] * columns / total for word in words]
+    aliases = [0] * columns
+
+    small = [index for index, value in enumerate(probabilities) if value < 1]
+    large = [index for index, value in enumerate(probabilities) if value >= 1]
+
+    # We fill every small column with the excess of a large one.
+    while small and large:
+
+        small_index = small.pop()
+        large_index = large.pop()
+
+        aliases[small_index] = large_index
+        probabilities[large_index] += probabilities[small_index] - 1
+
+        if probabilities[large_index] < 1:
+            small.append(large_index)
+        else:
+            large.append(large_index)
+
+    # Whatever is left is only off by rounding errors.
+    for index in small + large:
+        probabilities[index] = 1.0
+
+    return (words, probabilities, aliases)
+
+
+def sample_suffix(table):
+    """Picks one word from an alias table.
+
+    Parameters
+    ----------
+    table : tuple
+        A table created by build_alias_table().
+
+    Returns
+    -------
+    int
+        The id of the selected word.
+
+    """
+
+    words, probabilities, aliases = table
+
+    if probabilities is None:
+        return words[0]
+
+    column = random.randrange(len(words))
+
+    if random.random() < probabilities[column]:
+        return words[column]
+
+    return words[aliases[column]]
+
+
+def pack_state(word_ids, base):
+    """Packs a sequence of word ids into a single integer.
+
+    Each id is stored as a digit of id + 1 in the given base, so sequences of
+    different lengths never share the same number.
+
+    Parameters
+    ----------
+    word_ids : iterable
+        The ids of the words.
+
+    base : int
+        The size of the vocabulary plus one.
+
+    Returns
+    -------
+    int
+        The packed state.
+
+    """
+
+    state = 0
+
+    for word_id in word_ids:
+        state = state * base + word_id + 1
+
+    return state
+
+
+def build_sampling_tables(model, vocabulary, ignored_patterns=()):
+    """Converts the model words to ids and creates an alias table for each prefix.
+
+    Parameters
+    ----------
+    model : dict
+        The dictionary containing all the pairs and their possible outcomes.
+
+    vocabulary : vocabulary.Vocabulary
+        Where the ids of the words are added.
+
+    ignored_patterns : list
+        The prefixes that contain any of these strings are skipped.
+
+    Returns
+    -------
+    tuple
+        The list of prefixes as tuples of word ids and a dict of their packed
+        states and their alias tables of word ids.
+
+    """
+
+    # A single regular expression checks all the patterns in one pass over each prefix.
+    ignored_prefix = None
+
+    if ignored_patterns:
+        ignored_prefix = re.compile("|".join(map(re.escape, ignored_patterns)))
+
+    encoded_model = list()
+
+    for prefix, suffixes in model.items():
+
+        if not suffixes or (ignored_prefix is not None and ignored_prefix.search(prefix)):
+            continue
+
+        encoded_model.append((tuple(vocabulary.encode(prefix.split())), vocabulary.encode(suffixes)))
+
+    # We can only pack the states once we know the size of the vocabulary.
+    base = len(vocabulary) + 1
+
+    prefixes = [prefix_ids for prefix_ids, _ in encoded_model]
+    tables = {pack_state(prefix_ids, base): build_alias_table(suffix_ids)
+              for prefix_ids, suffix_ids in encoded_model}
+
+    return prefixes, tables
+
+
+def get_next_state(state_start, suffix):
+    """Returns the state the chain moves to after a prefix and suffix.
+
+    Parameters
+    ----------
+    state_start : str
+        The prefix without its first word, see get_state_start().
+
+    suffix : str
+        The next word.
+
+    Returns
+    -------
+    str
+        The next prefix.
+
+    """
+
+    if state_start:
+        return state_start + " " + suffix
+
+    return suffix
+
+
+def get_state_start(prefix):
+    """Returns the prefix without its first word, the part every next state starts with.
+
+    Parameters
+    ----------
+    prefix : str
+        The prefix.
+
+    Returns
+    -------
+    str
+        The remaining words, an empty string for first-order prefixes.
+
+    """
+
+    return prefix.partition(" ")[2]
+
+
+def find_dead_states(model):
+    """Finds the states the chain can move to that are not prefixes in the model.
+
+    Parameters
+    ----------
+    model : dict
+        The dictionary containing all the pairs and their possible outcomes.
+
+    Returns
+    -------
+    tuple
+        The set of unknown states, the number of transitions that lead to them
+        and the total number of transitions.
+
+    """
+
+    dead_states = set()
+    dead_transitions = 0
+    total_transitions = 0
+
+    for prefix, suffixes in model.items():
+
+        state_start = get_state_start(prefix)
+        total_transitions += len(suffixes)
+
+        # We only build each next state once, most suffixes are repeated.
+        dead_suffixes = {suffix for suffix in set(suffixes)
+                         if get_next_state(state_start, suffix) not in model}
+
+        if dead_suffixes:
+            dead_states.update(get_next_state(state_start, suffix) for suffix in dead_suffixes)
+            dead_transitions += sum(suffix in dead_suffixes for suffix in suffixes)
+
+    return (dead_states, dead_transitions, total_transitions)
+
+
+def relink_dead_states(model, dead_states, order):
+    """Adds the unknown states to the model using the outcomes of a lower order.
+
+    The outcomes of an unknown state are all the outcomes of the prefixes that end
+    with its last `order - 1` words.
+
+    Parameters
+    ----------
+    model : dict
+        The dictionary containing all the pairs and their possible outcomes.
+
+    dead_states : set
+        The states returned by find_dead_states().
+
+    order : int
+        The number of words in each prefix.
+
+    Returns
+    -------
+    int
+        The number of states that were added.
+
+    """
+
+    if order < 2:
+        return 0
+
+    # We only aggregate the lower order states we need.
+    lower_states = {get_state_start(state) for state in dead_states}
+    lower_model = dict()
+
+    for prefix, suffixes in model.items():
+
+        lower_state = get_state_start(prefix)
+
+        if lower_state in lower_states:
+            lower_model.setdefault(lower_state, []).extend(suffixes)
+
+    relinked_states = 0
+
+    for state in dead_states:
+
+        suffixes = lower_model.get(get_state_start(state))
+
+        if suffixes is not None:
+            model[state] = suffixes
+            relinked_states += 1
+
+    return relinked_states
+
+
+def find_predecessors(model, states):
+    """Finds the prefixes that could move the chain to any of the given states.
+
+    Parameters
+    ----------
+    model : dict
+        The dictionary containing all the pairs and their possible outcomes.
+
+    states : iterable
+        The states, they don't need to be in the model.
+
+    Returns
+    -------
+    list
+        The prefixes that end with the first words of any of the states.
+
+    """
+
+    state_heads = {state.rpartition(" ")[0] for state in states}
+
+    return [prefix for prefix in model if get_state_start(prefix) in state_heads]
+
+
+def prune_dead_ends(model, prefixes=None):
+    """Removes the outcomes that lead to unknown states until none are left.
+
+    Prefixes that lose all their outcomes are removed too, which can create new dead
+    ends in the prefixes that lead to them, so those are checked again.
+
+    Parameters
+    ----------
+    model : dict
+        The dictionary containing all the pairs and their possible outcomes.
+
+    prefixes : list
+        The prefixes that can have dead ends, all of them by default.
+
+    Returns
+    -------
+    tuple
+        The number of removed outcomes and the number of removed prefixes.
+
+    """
+
+    pruned_suffixes = 0
+    removed_prefixes = 0
+    predecessors = None
+
+    if prefixes is None:
+        prefixes = model.keys()
+
+    # A set, so a prefix that leads to several removed ones is only checked again once.
+    pending_prefixes = set(prefixes)
+
+    while pending_prefixes:
+
+        prefix = pending_prefixes.pop()
+        suffixes = model.get(prefix)
+
+        if suffixes is None:
+            continue
+
+        state_start = get_state_start(prefix)
+        dead_suffixes = {suffix for suffix in set(suffixes)
+                         if get_next_state(state_start, suffix) not in model}
+
+        if not dead_suffixes:
+            continue
+
+        # Relinked states share their lists, so we never modify them in place.
+        kept_suffixes = [suffix for suffix in suffixes if suffix not in dead_suffixes]
+        pruned_suffixes += len(suffixes) - len(kept_suffixes)
+
+        if kept_suffixes:
+            model[prefix] = kept_suffixes
+            continue
+
+        del model[prefix]
+        removed_prefixes += 1
+
+        # Removing a prefix is rare, so we only index the predecessors the first time it happens.
+        if predecessors is None:
+            predecessors = dict()
+
+            for other_prefix in model:
+                predecessors.setdefault(get_state_start(other_prefix), []).append(other_prefix)
+
+        pending_prefixes.update(predecessors.get(prefix.rpartition(" ")[0], []))
+
+    return (pruned_suffixes, removed_prefixes)
+
+
+def close_chain(model, order, mode, max_iterations=10):
+    """Removes or re-links the dead ends of the model so generation never has to restart.
+
+    Parameters
+    ----------
+    model : dict
+        The dictionary containing all the pairs and their possible outcomes, it is modified in place.
+
+    order : int
+        The number of words in each prefix.
+
+    mode : str
+        'relink' adds the unknown states using lower order outcomes and prunes what's left,
+        'prune' only removes the outcomes that lead to unknown states.
+
+    max_iterations : int
+        The maximum number of relink passes, new states can have dead ends of their own.
+
+    Returns
+    -------
+    dict
+        A report with the reachability of the chain before and after.
+
+    """
+
+    dead_states, dead_transitions, total_transitions = find_dead_states(model)
+
+    report = {"prefixes_before": len(model),
+              "dead_states_before": len(dead_states),
+              "reachability_before": 1 - dead_transitions / max(total_transitions, 1),
+              "relinked_states": 0}
+
+    if mode == "relink":
+
+        for _ in range(max_iterations):
+
+            if len(dead_states) == 0:
+                break
+
+            relinked_states = relink_dead_states(model, dead_states, order)
+
+            if relinked_states == 0:
+                break
+
+            report["relinked_states"] += relinked_states
+            dead_states, _, _ = find_dead_states(model)
+
+    report["pruned_suffixes"], report["removed_prefixes"] = prune_dead_ends(model)
+    report["prefixes_after"] = len(model)
+
+    _, dead_transitions, total_transitions = find_dead_states(model)
+    report["reachability_after"] = 1 - dead_transitions / max(total_transitions, 1)
+
+    return report
+
+
+def normalize_word(word):
+    """Removes the surrounding punctuation of a word and converts it to lowercase.
+
+    Parameters
+    ----------
+    word : str
+        A word from the model or from a context.
+
+    Returns
+    -------
+    str
+        The normalized word, it can be empty if the word was only punctuation.
+
+    """
+
+    return word.strip(string.punctuation).lower()
+
+
+def get_context_keywords(context, stop_words):
+    """Splits a context into normalized keywords and counts them.
+
+    Parameters
+    ----------
+    context : str
+        A sentence which will be separated into keywords.
+
+    stop_words : set
+        The words that will be ignored.
+
+    Returns
+    -------
+    collections.Counter
+        The keywords and the number of times they appear in the context.
+
+    """
+
+    keywords = Counter()
+
+    for word in context.split():
+
+        keyword = normalize_word(word)
+
+        # We remove short words and stop words from the context.
+        if len(keyword) <= 3 or keyword in stop_words:
+            continue
+
+        keywords[keyword] += 1
+
+    return keywords
+
+
+def get_cache_key(context_keywords):
+    """Creates a hashable key from the context keywords, the order of the words doesn't matter.
+
+    Parameters
+    ----------
+    context_keywords : collections.Counter
+        The keywords returned by get_context_keywords().
+
+    Returns
+    -------
+    tuple
+        The sorted keywords and their frequencies.
+
+    """
+
+    return tuple(sorted(context_keywords.items()))
+
+
+def build_context_index(prefixes, words):
+    """Creates an inverted index from normalized words to the prefixes that contain them.
+
+    Only prefixes that don't end a sentence are indexed since they are used to start
+    new comments.
+
+    Parameters
+    ----------
+    prefixes : list
+        The prefixes of the model as tuples of word ids.
+
+    words : list
+        The vocabulary words, their position is their id.
+
+    Returns
+    -------
+    tuple
+        The inverted index and the IDF weight of each indexed word.
+
+    """
+
+    # Each vocabulary word is normalized once instead of once per prefix.
+    normalized_words = [normalize_word(word) for word in words]
+    index = dict()
+
+    for prefix in prefixes:
+
+        if words[prefix[-1]].endswith(SENTENCE_ENDINGS):
+            continue
+
+        for word in set(normalized_words[word_id] for word_id in prefix):
+            if word:
+                index.setdefault(word, []).append(prefix)
+
+    total_prefixes = len(prefixes)
+    weights = {word: math.log(total_prefixes / len(word_prefixes))
+               for word, word_prefixes in index.items()}
+
+    return (index, weights)
+
+
+def score_candidate(candidate, context_keywords):
+    """Scores a generated comment, higher is better.
+
+    Comments close to IDEAL_COMMENT_LENGTH words that mention more of the context
+    keywords score higher. Every random restart and hitting MAX_STEPS are penalized.
+
+    Parameters
+    ----------
+    candidate : dict
+        A candidate returned by MarkovChain.generate_candidates().
+
+    context_keywords : collections.Counter
+        The keywords returned by get_context_keywords().
+
+    Returns
+    -------
+    float
+        The score of the candidate.
+
+    """
+
+    words = candidate["words"]
+    score = min(len(words), IDEAL_COMMENT_LENGTH) / IDEAL_COMMENT_LENGTH
+
+    if len(context_keywords) > 0:
+        covered_keywords = set(normalize_word(word) for word in words) & context_keywords.keys()
+        score += KEYWORD_COVERAGE_WEIGHT * len(covered_keywords) / len(context_keywords)
+
+    score -= RESTART_PENALTY * candidate["restarts"]
+
+    if not candidate["finished"]:
+        score -= UNFINISHED_PENALTY
+
+    return score
+
+
+class MarkovChain:
+    """Holds the precomputed sampling tables of a model and generates comments from them.
+
+    Parameters
+    ----------
+    model : dict
+        The dictionary containing all the pairs and their possible outcomes.
+
+    order : int
+        The number of words in the state, this must match the order number in step2.py
+
+    cache : cache.LRUCache
+        An optional cache for the ranked prefixes of each context.
+
+    cache_replies : bool
+        Whether to keep the unused candidates in the cache and post them the next
+        time the same context arrives. It requires a cache.
+
+    ignored_patterns : list
+        The prefixes that contain any of these strings are left out, such as
+        IGNORED_PREFIX_PATTERNS.
+
+    """
+
+    def __init__(self, model, order, cache=None, cache_replies=False, ignored_patterns=()):
+
+        self.order = order
+        self.vocabulary = Vocabulary()
+        self.prefixes, self.tables = build_sampling_tables(model, self.vocabulary, ignored_patterns)
+        self.version = next(_MODEL_VERSIONS)
+
+        self.cache = cache
+        self.cache_replies = cache_replies
+
+        # The states are packed with these two so each step only needs integer arithmetic.
+        self.base = len(self.vocabulary) + 1
+        self.modulus = self.base ** order
+
+        # The ids of the words that end a sentence.
+        self.sentence_endings = {word_id for word_id, word in enumerate(self.vocabulary.words)
+                                 if word.endswith(SENTENCE_ENDINGS)}
+
+        # The context index is only built when it's first needed.
+        self._context_index = None
+
+    def get_prefix_ids(self):
+        """Get a random prefix that starts in uppercase and doesn't end a sentence.
+
+        Returns
+        -------
+        tuple
+            The word ids of the randomly selected prefix.
+
+        """
+
+        words = self.vocabulary.words
+
+        # We give it a maximum of 10,000 tries.
+        for _ in range(10000):
+
+            random_prefix = random.choice(self.prefixes)
+
+            if words[random_prefix[0]][0].isupper() and random_prefix[-1] not in self.sentence_endings:
+                break
+
+        return random_prefix
+
+    def get_prefix(self):
+        """Get a random prefix that starts in uppercase.
+
+        Returns
+        -------
+        str
+            The randomly selected prefix.
+
+        """
+
+        return self.vocabulary.decode(self.get_prefix_ids())
+
+    def get_random_prefix(self):
+        """Get any random prefix.
+
+        Returns
+        -------
+        str
+            The randomly selected prefix.
+
+        """
+
+        return self.vocabulary.decode(random.choice(self.prefixes))
+
+    def get_context_index(self):
+        """Returns the inverted index and IDF weights, building them on the first call.
+
+        Returns
+        -------
+        tuple
+            The values returned by build_context_index().
+
+        """
+
+        if self._context_index is None:
+            self._context_index = build_context_index(self.prefixes, self.vocabulary.words)
+
+        return self._context_index
+
+    def rank_prefixes(self, context_keywords, top_k=CONTEXT_TOP_K):
+        """Ranks the prefixes that share words with the context by their TF-IDF score.
+
+        A prefix scores the IDF weight of each keyword it contains, multiplied by the
+        number of times the keyword appears in the context. The cost depends on the
+        number of keywords, not on the size of the model.
+
+        Parameters
+        ----------
+        context_keywords : collections.Counter
+            The keywords returned by get_context_keywords().
+
+        top_k : int
+            The maximum number of prefixes to return.
+
+        Returns
+        -------
+        list
+            Tuples of score and prefix ids, best first.
+
+        """
+
+        index, weights = self.get_context_index()
+        scores = dict()
+
+        for keyword, frequency in context_keywords.items():
+
+            candidates = index.get(keyword)
+
+            if candidates is None:
+                continue
+
+            if len(candidates) > MAX_CANDIDATES_PER_KEYWORD:
+                candidates = random.sample(candidates, MAX_CANDIDATES_PER_KEYWORD)
+
+            weight = weights[keyword] * frequency
+
+            for prefix in candidates:
+                scores[prefix] = scores.get(prefix, 0) + weight
+
+        # A random tiebreaker avoids returning the same prefixes for a single keyword.
+        best = heapq.nlargest(top_k, scores.items(),
+                              key=lambda item: (item[1], random.random()))
+
+        return [(score, prefix) for prefix, score in best]
+
+    def get_prefix_with_context(self, context, stop_words):
+        """Get a prefix that matches the given context.
+
+        Parameters
+        ----------
+        context : str
+            A sentence which will be separated into keywords.
+
+        stop_words : set
+            The words that will be ignored.
+
+        Returns
+        -------
+        str
+            A prefix chosen from the best ranked ones, weighted by their score.
+
+        """
+
+        cache_entry = self.get_cache_entry(get_context_keywords(context, stop_words))
+        return self.vocabulary.decode(self.choose_seeds(cache_entry["ranked_prefixes"], 1)[0])
+
+    def get_cache_entry(self, context_keywords):
+        """Returns the ranked prefixes of a context, from the cache when possible.
+
+        Parameters
+        ----------
+        context_keywords : collections.Counter
+            The keywords returned by get_context_keywords().
+
+        Returns
+        -------
+        dict
+            The ranked prefixes and the pre-generated replies of the context.
+
+        """
+
+        if self.cache is None:
+            return {"ranked_prefixes": self.rank_prefixes(context_keywords), "replies": []}
+
+        # The cache clears itself if it was filled by another model.
+        self.cache.bind(self.version)
+
+        key = get_cache_key(context_keywords)
+        cache_entry = self.cache.get(key)
+
+        if cache_entry is None:
+            cache_entry = {"ranked_prefixes": self.rank_prefixes(context_keywords), "replies": []}
+            self.cache.put(key, cache_entry)
+
+        return cache_entry
+
+    def choose_seeds(self, ranked_prefixes, number_of_seeds):
+        """Chooses initial prefixes from the ranked ones, weighted by their score.
+
+        Parameters
+        ----------
+        ranked_prefixes : list
+            The tuples returned by rank_prefixes().
+
+        number_of_seeds : int
+            The number of prefixes to choose, they can repeat.
+
+        Returns
+        -------
+        list
+            The word ids of the chosen prefixes.
+
+        """
+
+        # If our context has no matching keywords we fallback to the random prefix method.
+        if len(ranked_prefixes) == 0:
+            return [self.get_prefix_ids() for _ in range(number_of_seeds)]
+
+        prefixes = [prefix for _, prefix in ranked_prefixes]
+        scores = [score for score, _ in ranked_prefixes]
+
+        # Words that appear in every prefix have a weight of zero.
+        if sum(scores) == 0:
+            return random.choices(prefixes, k=number_of_seeds)
+
+        return random.choices(prefixes, weights=scores, k=number_of_seeds)
+
+    def generate_candidates(self, number_of_sentences, initial_prefixes):
+        """Generates one comment for each initial prefix in a single pass.
+
+        All the chains advance one word per step over the same sampling tables.
+        The latest state of each one is kept packed as a single integer, so each
+        step is an integer lookup and the words are only joined at the end.
+
+        Parameters
+        ----------
+        number_of_sentences : int
+            The maximum number of sentences.
+
+        initial_prefixes : list
+            The word(s) that will start each chain, either strings or tuples of word ids.
+
+        Returns
+        -------
+        list
+            A dictionary for each chain with its words, the number of sentences,
+            the number of random restarts and whether it finished before MAX_STEPS.
+
+        """
+
+        ids = self.vocabulary.ids
+        words = self.vocabulary.words
+        candidates = list()
+
+        for initial_prefix in initial_prefixes:
+
+            if isinstance(initial_prefix, str):
+                prefix_words = initial_prefix.split()
+                prefix_ids = [ids.get(word) for word in prefix_words[-self.order:]]
+                word_ids = list()
+            else:
+                prefix_words = list()
+                prefix_ids = initial_prefix[-self.order:]
+                word_ids = list(initial_prefix)
+
+            # Words that are not in the model can't be packed, the chain restarts on its first step.
+            if None in prefix_ids:
+                state = None
+            else:
+                state = pack_state(prefix_ids, self.base)
+
+            candidates.append({"prefix_words": prefix_words,
+                               "word_ids": word_ids,
+                               "state": state,
+                               "sentences": 0,
+                               "restarts": 0,
+                               "finished": False})
+
+        active_candidates = candidates
+
+        for _ in range(MAX_STEPS):
+
+            if len(active_candidates) == 0:
+                break
+
+            still_active = list()
+
+            for candidate in active_candidates:
+
+                table = self.tables.get(candidate["state"])
+
+                if table is None:
+                    # If we don't get another word we take another prefix randomly and continue the chain.
+                    new_ids = self.get_prefix_ids()
+                    candidate["word_ids"].extend(new_ids)
+                    candidate["state"] = pack_state(new_ids, self.base)
+                    candidate["restarts"] += 1
+                    word_id = new_ids[-1]
+                else:
+                    word_id = sample_suffix(table)
+                    candidate["word_ids"].append(word_id)
+                    # We shift the oldest word out of the state and add the new one.
+                    candidate["state"] = (candidate["state"] * self.base + word_id + 1) % self.modulus
+
+                if word_id in self.sentence_endings:
+                    candidate["sentences"] += 1
+
+                if candidate["sentences"] >= number_of_sentences:
+                    candidate["finished"] = True
+                else:
+                    still_active.append(candidate)
+
+            active_candidates = still_active
+
+        for candidate in candidates:
+
+            candidate["words"] = candidate.pop("prefix_words") + [words[word_id]
+                                                                  for word_id in candidate.pop("word_ids")]
+            del candidate["state"]
+
+        return candidates
+
+    def generate_comment(self, number_of_sentences, initial_prefix):
+        """Generates a new comment using an initial prefix.
+
+        Parameters
+        ----------
+        number_of_sentences : int
+            The maximum number of sentences.
+
+        initial_prefix : str
+            The word(s) that will start the chain, a tuple of word ids also works.
+
+        Returns
+        -------
+        str
+            The newly generated text.
+
+        """
+
+        candidate = self.generate_candidates(number_of_sentences, [initial_prefix])[0]
+        return " ".join(candidate["words"])
+
+    def generate_best_comment(self, number_of_sentences, context, stop_words, number_of_candidates):
+        """Generates several context-aware comments and returns the best scored one.
+
+        The context is only ranked once and all candidates are generated in the same pass.
+        If cache_replies is enabled, a reply left over from the last time we saw the
+        same context is returned instead.
+
+        Parameters
+        ----------
+        number_of_sentences : int
+            The maximum number of sentences.
+
+        context : str
+            A sentence which will be separated into keywords.
+
+        stop_words : set
+            The words that will be ignored.
+
+        number_of_candidates : int
+            The number of comments to generate.
+
+        Returns
+        -------
+        str
+            The newly generated text.
+
+        """
+
+        context_keywords = get_context_keywords(context, stop_words)
+        cache_entry = self.get_cache_entry(context_keywords)
+
+        # The pool worker and the scheduler can share the same entry, so another thread
+        # could take the last reply between a check and the pop. We pop and fall through instead.
+        if self.cache_replies:
+            try:
+                return cache_entry["replies"].pop()
+            except IndexError:
+                pass
+
+        initial_prefixes = self.choose_seeds(cache_entry["ranked_prefixes"], number_of_candidates)
+
+        candidates = self.generate_candidates(number_of_sentences, initial_prefixes)
+        candidates.sort(key=lambda candidate: score_candidate(candidate, context_keywords))
+
+        if self.cache_replies:
+            # We keep the finished runners-up, the best of them will be popped first.
+            cache_entry["replies"] = [" ".join(candidate["words"])
+                                      for candidate in candidates[:-1] if candidate["finished"]]
+
+        return " ".join(candidates[-1]["words"])
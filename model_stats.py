@@ -0,0 +1,376 @@
+"""
+Exports the statistics and the transition table of a training model to a folder of
+columnar binary files and answers simple questions about them without loading the
+pickle.
+
+Each column is a flat array of unsigned 32 bit integers, so a query only reads the
+columns it needs. Usage examples:
+
+    python model_stats.py model_stats summary
+    python model_stats.py model_stats top-prefixes -n 20
+    python model_stats.py model_stats branching
+    python model_stats.py model_stats dead-ends -n 20
+    python model_stats.py model_stats subreddits
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import os
+import statistics
+import sys
+from array import array
+from collections import Counter
+
+from markov import get_next_state, get_state_start
+
+
+METADATA_FILE = "metadata.json"
+VOCABULARY_FILE = "vocabulary.txt"
+SUBREDDITS_FILE = "subreddits.csv"
+
+# The array typecode of all columns, an unsigned int of at least 4 bytes.
+TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+# The upper bounds of the branching factor histogram.
+BRANCHING_BUCKETS = [1, 2, 5, 10, 100, 1000]
+
+
+def write_column(folder, name, values):
+    """Saves a column as a binary file.
+
+    Parameters
+    ----------
+    folder : str
+        The export folder.
+
+    name : str
+        The name of the column.
+
+    values : array.array
+        The values of the column.
+
+    """
+
+    with open(os.path.join(folder, "{}.bin".format(name)), "wb") as column_file:
+        values.tofile(column_file)
+
+
+def read_column(folder, name, metadata):
+    """Loads a column saved by write_column().
+
+    Parameters
+    ----------
+    folder : str
+        The export folder.
+
+    name : str
+        The name of the column.
+
+    metadata : dict
+        The exported metadata, used to know the length and byte order of the column.
+
+    Returns
+    -------
+    array.array
+        The values of the column.
+
+    """
+
+    values = array(TYPECODE)
+    length = metadata["columns"][name]
+
+    with open(os.path.join(folder, "{}.bin".format(name)), "rb") as column_file:
+        values.fromfile(column_file, length)
+
+    if metadata["byteorder"] != sys.byteorder:
+        values.byteswap()
+
+    return values
+
+
+def export_model_stats(model, order, folder, subreddits=None):
+    """Saves the model statistics and its transition table as columns.
+
+    The prefix columns have one row per prefix: the vocabulary id of each of its
+    words, its frequency, its branching factor (unique suffixes) and its number of
+    dead ends (unique suffixes whose next state is not in the model).
+
+    The transition columns have one row per unique prefix and suffix pair.
+
+    Parameters
+    ----------
+    model : dict
+        The dictionary containing all the pairs and their possible outcomes.
+
+    order : int
+        The number of words in each prefix.
+
+    folder : str
+        The folder where the files will be saved, it is created if it doesn't exist.
+
+    subreddits : dict
+        Optional, the number of comments, words and the set of unique words of each subreddit.
+
+    """
+
+    os.makedirs(folder, exist_ok=True)
+
+    vocabulary = dict()
+
+    def get_word_id(word):
+        return vocabulary.setdefault(word, len(vocabulary))
+
+    prefix_words = [array(TYPECODE) for _ in range(order)]
+    prefix_frequency = array(TYPECODE)
+    prefix_branching = array(TYPECODE)
+    prefix_dead_ends = array(TYPECODE)
+
+    transition_prefix = array(TYPECODE)
+    transition_suffix = array(TYPECODE)
+    transition_count = array(TYPECODE)
+
+    for row, (prefix, suffixes) in enumerate(model.items()):
+
+        words = prefix.split()
+
+        for position in range(order):
+            # Prefixes shorter than the order only happen in hand made models.
+            word = words[position] if position < len(words) else ""
+            prefix_words[position].append(get_word_id(word))
+
+        suffix_counts = Counter(suffixes)
+        state_start = get_state_start(prefix)
+        dead_ends = 0
+
+        for suffix, count in suffix_counts.items():
+
+            transition_prefix.append(row)
+            transition_suffix.append(get_word_id(suffix))
+            transition_count.append(count)
+
+            if get_next_state(state_start, suffix) not in model:
+                dead_ends += 1
+
+        prefix_frequency.append(len(suffixes))
+        prefix_branching.append(len(suffix_counts))
+        prefix_dead_ends.append(dead_ends)
+
+    columns = {"prefix_frequency": prefix_frequency,
+               "prefix_branching": prefix_branching,
+               "prefix_dead_ends": prefix_dead_ends,
+               "transition_prefix": transition_prefix,
+               "transition_suffix": transition_suffix,
+               "transition_count": transition_count}
+
+    for position, values in enumerate(prefix_words):
+        columns["prefix_word_{}".format(position)] = values
+
+    for name, values in columns.items():
+        write_column(folder, name, values)
+
+    with open(os.path.join(folder, VOCABULARY_FILE), "w", encoding="utf-8") as vocabulary_file:
+        vocabulary_file.write("\n".join(vocabulary.keys()))
+
+    if subreddits is not None:
+        with open(os.path.join(folder, SUBREDDITS_FILE), "w", newline="", encoding="utf-8") as subreddits_file:
+
+            writer = csv.writer(subreddits_file)
+            writer.writerow(["subreddit", "comments", "words", "vocabulary_size"])
+
+            for subreddit, values in sorted(subreddits.items()):
+                writer.writerow([subreddit, values["comments"], values["words"],
+                                 len(values["vocabulary"])])
+
+    metadata = {"order": order,
+                "prefixes": len(model),
+                "transitions": len(transition_count),
+                "vocabulary_size": len(vocabulary),
+                "byteorder": sys.byteorder,
+                "columns": {name: len(values) for name, values in columns.items()}}
+
+    with open(os.path.join(folder, METADATA_FILE), "w", encoding="utf-8") as metadata_file:
+        json.dump(metadata, metadata_file, indent=4)
+
+
+def read_metadata(folder):
+    """Loads the metadata of an export folder.
+
+    Parameters
+    ----------
+    folder : str
+        The export folder.
+
+    Returns
+    -------
+    dict
+        The exported metadata.
+
+    """
+
+    with open(os.path.join(folder, METADATA_FILE), "r", encoding="utf-8") as metadata_file:
+        return json.load(metadata_file)
+
+
+def read_vocabulary(folder):
+    """Loads the vocabulary of an export folder.
+
+    Parameters
+    ----------
+    folder : str
+        The export folder.
+
+    Returns
+    -------
+    list
+        The words, their position is their id.
+
+    """
+
+    with open(os.path.join(folder, VOCABULARY_FILE), "r", encoding="utf-8") as vocabulary_file:
+        return vocabulary_file.read().split("\n")
+
+
+def get_prefixes(folder, metadata, rows):
+    """Rebuilds the text of the prefixes in the given rows.
+
+    Parameters
+    ----------
+    folder : str
+        The export folder.
+
+    metadata : dict
+        The exported metadata.
+
+    rows : list
+        The rows of the prefixes.
+
+    Returns
+    -------
+    list
+        The prefixes in the same order as the rows.
+
+    """
+
+    vocabulary = read_vocabulary(folder)
+    prefix_words = [read_column(folder, "prefix_word_{}".format(position), metadata)
+                    for position in range(metadata["order"])]
+
+    return [" ".join(vocabulary[column[row]] for column in prefix_words).strip() for row in rows]
+
+
+def print_summary(folder, metadata):
+    """Prints the size of the model and its number of dead ends."""
+
+    prefix_dead_ends = read_column(folder, "prefix_dead_ends", metadata)
+
+    print("Order:", metadata["order"])
+    print("Prefixes:", metadata["prefixes"])
+    print("Transitions:", metadata["transitions"])
+    print("Vocabulary size:", metadata["vocabulary_size"])
+    print("Prefixes with dead ends:", sum(1 for value in prefix_dead_ends if value > 0))
+    print("Dead end transitions:", sum(prefix_dead_ends))
+
+
+def print_top_prefixes(folder, metadata, number_of_prefixes):
+    """Prints the most frequent prefixes."""
+
+    prefix_frequency = read_column(folder, "prefix_frequency", metadata)
+    rows = heapq.nlargest(number_of_prefixes, range(len(prefix_frequency)),
+                          key=prefix_frequency.__getitem__)
+
+    for row, prefix in zip(rows, get_prefixes(folder, metadata, rows)):
+        print(prefix_frequency[row], prefix)
+
+
+def print_branching(folder, metadata):
+    """Prints the distribution of the number of unique suffixes of each prefix."""
+
+    prefix_branching = read_column(folder, "prefix_branching", metadata)
+
+    if len(prefix_branching) == 0:
+        print("The model is empty.")
+        return
+
+    histogram = Counter()
+
+    for value in prefix_branching:
+        for bucket in BRANCHING_BUCKETS:
+            if value <= bucket:
+                histogram[bucket] += 1
+                break
+        else:
+            histogram[None] += 1
+
+    print("Mean:", round(statistics.mean(prefix_branching), 2))
+    print("Median:", statistics.median(prefix_branching))
+    print("Max:", max(prefix_branching))
+
+    lower_bound = 1
+
+    for bucket in BRANCHING_BUCKETS:
+        print("{}-{}:".format(lower_bound, bucket), histogram[bucket])
+        lower_bound = bucket + 1
+
+    print(">{}:".format(BRANCHING_BUCKETS[-1]), histogram[None])
+
+
+def print_dead_ends(folder, metadata, number_of_prefixes):
+    """Prints the prefixes with the most suffixes that lead to unknown states."""
+
+    prefix_dead_ends = read_column(folder, "prefix_dead_ends", metadata)
+    rows = [row for row in heapq.nlargest(number_of_prefixes, range(len(prefix_dead_ends)),
+                                          key=prefix_dead_ends.__getitem__)
+            if prefix_dead_ends[row] > 0]
+
+    for row, prefix in zip(rows, get_prefixes(folder, metadata, rows)):
+        print(prefix_dead_ends[row], prefix)
+
+
+def print_subreddits(folder):
+    """Prints the number of comments, words and vocabulary size of each subreddit."""
+
+    try:
+        with open(os.path.join(folder, SUBREDDITS_FILE), "r", encoding="utf-8") as subreddits_file:
+            for row in csv.reader(subreddits_file):
+                print(", ".join(row))
+
+    except FileNotFoundError:
+        print("This model was not trained from .csv files.")
+
+
+def init():
+    """Parses the command line arguments and runs the requested query."""
+
+    parser = argparse.ArgumentParser(description="Query the statistics exported by step2.py")
+    parser.add_argument("folder", help="The folder set in STATS_FOLDER.")
+
+    subparsers = parser.add_subparsers(dest="query", required=True)
+    subparsers.add_parser("summary", help="The size of the model.")
+    subparsers.add_parser("branching", help="The branching factor distribution.")
+    subparsers.add_parser("subreddits", help="The vocabulary size per subreddit.")
+
+    for name, help_text in [("top-prefixes", "The most frequent prefixes."),
+                            ("dead-ends", "The prefixes with the most dead ends.")]:
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("-n", type=int, default=20, help="The number of prefixes.")
+
+    args = parser.parse_args()
+    metadata = read_metadata(args.folder)
+
+    if args.query == "summary":
+        print_summary(args.folder, metadata)
+    elif args.query == "top-prefixes":
+        print_top_prefixes(args.folder, metadata, args.n)
+    elif args.query == "branching":
+        print_branching(args.folder, metadata)
+    elif args.query == "dead-ends":
+        print_dead_ends(args.folder, metadata, args.n)
+    elif args.query == "subreddits":
+        print_subreddits(args.folder)
+
+
+if __name__ == "__main__":
+
+    init()
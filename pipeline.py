@@ -0,0 +1,655 @@
+"""
+Runs the whole ETL process from a single config file: downloads the comments,
+cleans them, trains one model shard per source, merges the shards and exports the
+model statistics.
+
+Independent stages run at the same time and a stage is skipped when its input files
+and settings haven't changed since its last run. Usage:
+
+    python pipeline.py pipeline.json
+    python pipeline.py pipeline.json --force
+"""
+
+import argparse
+import csv
+import filecmp
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import step1
+import step1_alt
+import step2
+from markov import close_chain
+from model_stats import export_model_stats
+
+STATE_FILE = "pipeline_state.json"
+
+
+class Stage:
+    """A step of the pipeline.
+
+    Parameters
+    ----------
+    name : str
+        The unique name of the stage.
+
+    action : callable
+        The function that does the work, it takes no arguments.
+
+    dependencies : list
+        The names of the stages that must finish before this one.
+
+    inputs : list
+        The files this stage reads, it runs again when any of them changes.
+
+    outputs : list
+        The files this stage creates, it runs again when any of them is missing.
+
+    settings : dict
+        The config values this stage uses, it runs again when any of them changes.
+
+    max_age : float
+        The number of seconds before the stage runs again even if nothing changed.
+        None never expires.
+
+    """
+
+    def __init__(self, name, action, dependencies=(), inputs=(), outputs=(), settings=None, max_age=None):
+
+        self.name = name
+        self.action = action
+        self.dependencies = list(dependencies)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.settings = settings or dict()
+        self.max_age = max_age
+
+    def get_fingerprint(self):
+        """Describes the current inputs and settings of the stage.
+
+        Files are described by their size and modification time so we don't have to
+        read multi-GB models to know if they changed.
+
+        Returns
+        -------
+        str
+            A JSON string that changes when the inputs or settings change.
+
+        """
+
+        files = list()
+
+        for file_name in self.inputs:
+            file_stat = os.stat(file_name)
+            files.append([file_name, file_stat.st_size, file_stat.st_mtime_ns])
+
+        return json.dumps({"inputs": files, "settings": self.settings}, sort_keys=True)
+
+    def is_up_to_date(self, record, fingerprint):
+        """Checks if the last run of the stage is still valid.
+
+        Parameters
+        ----------
+        record : dict
+            The fingerprint and finish time of the last run, None if it never ran.
+
+        fingerprint : str
+            The current fingerprint of the stage.
+
+        Returns
+        -------
+        bool
+            Whether the stage can be skipped.
+
+        """
+
+        if record is None or record["fingerprint"] != fingerprint:
+            return False
+
+        if not all(os.path.exists(file_name) for file_name in self.outputs):
+            return False
+
+        if self.max_age is not None and time.time() - record["finished_at"] > self.max_age:
+            return False
+
+        return True
+
+
+def load_state(state_file):
+    """Reads the fingerprints of the previous runs.
+
+    Parameters
+    ----------
+    state_file : str
+        The location of the state file.
+
+    Returns
+    -------
+    dict
+        The fingerprint and finish time of each stage.
+
+    """
+
+    try:
+        with open(state_file, "r", encoding="utf-8") as temp_file:
+            return json.load(temp_file)
+
+    except FileNotFoundError:
+        return dict()
+
+
+def save_state(state_file, state):
+    """Saves the fingerprints of the finished stages.
+
+    Parameters
+    ----------
+    state_file : str
+        The location of the state file.
+
+    state : dict
+        The fingerprint and finish time of each stage.
+
+    """
+
+    with open(state_file + ".tmp", "w", encoding="utf-8") as temp_file:
+        json.dump(state, temp_file, indent=4)
+
+    os.replace(state_file + ".tmp", state_file)
+
+
+def run_stages(stages, state_file, workers, force=False):
+    """Runs the stages in dependency order, up to `workers` at the same time.
+
+    A stage starts as soon as all its dependencies have finished. If a stage fails
+    the stages that depend on it are skipped but the rest keep running.
+
+    Parameters
+    ----------
+    stages : list
+        The Stage objects to run.
+
+    state_file : str
+        Where the fingerprints of the finished stages are saved.
+
+    workers : int
+        The maximum number of stages running at the same time.
+
+    force : bool
+        Run all stages even if they are up to date.
+
+    Returns
+    -------
+    list
+        The names of the stages that failed or couldn't run.
+
+    """
+
+    state = load_state(state_file)
+    pending_stages = {stage.name: stage for stage in stages}
+    finished_stages = set()
+    failed_stages = list()
+    running_stages = dict()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        while pending_stages or running_stages:
+
+            # Skipping a stage can make its dependants ready, so we look again until nothing changes.
+            ready_found = True
+
+            while ready_found:
+
+                ready_found = False
+
+                for name, stage in list(pending_stages.items()):
+
+                    if any(dependency in failed_stages for dependency in stage.dependencies):
+                        print("Cancelled:", name)
+                        failed_stages.append(name)
+                        del pending_stages[name]
+                        ready_found = True
+                        continue
+
+                    if not all(dependency in finished_stages for dependency in stage.dependencies):
+                        continue
+
+                    del pending_stages[name]
+                    ready_found = True
+
+                    # A missing input fails the stage, its dependants are cancelled on the next pass.
+                    try:
+                        fingerprint = stage.get_fingerprint()
+                    except OSError as error:
+                        print("Failed:", name, error)
+                        failed_stages.append(name)
+                        continue
+
+                    if not force and stage.is_up_to_date(state.get(name), fingerprint):
+                        print("Up to date:", name)
+                        finished_stages.add(name)
+                    else:
+                        print("Running:", name)
+                        running_stages[executor.submit(stage.action)] = (stage, fingerprint)
+
+            if not running_stages:
+                # Whatever is left depends on stages that don't exist.
+                for name in pending_stages:
+                    print("Missing dependencies:", name)
+                    failed_stages.append(name)
+
+                break
+
+            done, _ = wait(running_stages, return_when=FIRST_COMPLETED)
+
+            for future in done:
+
+                stage, fingerprint = running_stages.pop(future)
+
+                try:
+                    future.result()
+                except Exception as error:
+                    print("Failed:", stage.name, error)
+                    failed_stages.append(stage.name)
+                    continue
+
+                print("Finished:", stage.name)
+                finished_stages.add(stage.name)
+                state[stage.name] = {"fingerprint": fingerprint, "finished_at": time.time()}
+                save_state(state_file, state)
+
+    return failed_stages
+
+
+def download_source(kind, name, csv_file):
+    """Downloads the comments of a username or subreddit to a .csv file.
+
+    Parameters
+    ----------
+    kind : str
+        Either 'username' or 'subreddit'.
+
+    name : str
+        The username or subreddit.
+
+    csv_file : str
+        Where the comments will be saved.
+
+    """
+
+    comments_list = list()
+
+    if kind == "username":
+        step1.load_comments(username=name, comments_list=comments_list)
+    else:
+        step1_alt.load_comments(subreddit=name, comments_list=comments_list)
+
+    # We write to a temporary file so an interrupted download doesn't look finished.
+    with open(csv_file + ".tmp", "w", newline="", encoding="utf-8") as temp_file:
+        writer = csv.writer(temp_file)
+        writer.writerow(["datetime", "subreddit", "body"])
+        writer.writerows(comments_list)
+
+    # The next stages are fingerprinted by modification time, so we keep the old file
+    # when nothing changed and they don't run again.
+    if os.path.exists(csv_file) and filecmp.cmp(csv_file + ".tmp", csv_file, shallow=False):
+        print("No new comments:", name)
+        os.remove(csv_file + ".tmp")
+    else:
+        os.replace(csv_file + ".tmp", csv_file)
+
+
+def clean_source(kind, source_file, clean_file, allowed_subreddits):
+    """Applies the step2.py clean up to a .csv file, or reads a .txt file as it is.
+
+    Parameters
+    ----------
+    kind : str
+        Either 'username', 'subreddit' or 'text'.
+
+    source_file : str
+        The downloaded .csv file or the .txt file.
+
+    clean_file : str
+        Where the comments and the subreddit statistics will be saved as JSON.
+
+    allowed_subreddits : list
+        The subreddits comments to keep (lowercase). An empty list will allow all.
+
+    """
+
+    subreddits = dict()
+
+    if kind == "text":
+        with open(source_file, "r", encoding="utf-8") as temp_file:
+            comments_list = [temp_file.read()]
+    else:
+        comments_list = step2.read_comments(source_file, allowed_subreddits, subreddits)
+
+    for values in subreddits.values():
+        values["vocabulary"] = sorted(values["vocabulary"])
+
+    with open(clean_file, "w", encoding="utf-8") as temp_file:
+        json.dump({"kind": kind, "comments": comments_list, "subreddits": subreddits}, temp_file)
+
+
+def train_shard(clean_file, shard_file, order):
+    """Trains the model of a single source.
+
+    Parameters
+    ----------
+    clean_file : str
+        The comments saved by clean_source().
+
+    shard_file : str
+        Where the model and its first and last words will be saved.
+
+    order : int
+        The number of words in each prefix.
+
+    """
+
+    with open(clean_file, "r", encoding="utf-8") as temp_file:
+        clean_data = json.load(temp_file)
+
+    comments_list = clean_data["comments"]
+
+    # Comments are downloaded newest first, we place them in their original order like step2.py.
+    if clean_data["kind"] != "text":
+        comments_list.reverse()
+
+    words_list = " ".join(comments_list).split()
+    word_dictionary = dict()
+    step2.add_transitions(word_dictionary, words_list, order)
+
+    # The first and last words are used to join this shard with its neighbours.
+    with open(shard_file, "wb") as temp_file:
+        pickle.dump({"model": word_dictionary,
+                     "head": words_list[:order],
+                     "tail": words_list[-order:]}, temp_file)
+
+
+def merge_shards(shard_files, model_file, order, dead_end_mode, clean_files=(), stats_folder=""):
+    """Merges the shards into a single model, removes its ignored prefixes and dead ends and saves it.
+
+    The transitions that cross from one shard to the next are added too, so the
+    result has the same outcomes step2.py would find in the same comments.
+
+    Parameters
+    ----------
+    shard_files : list
+        The shards in the order their words should be joined.
+
+    model_file : str
+        Where the model will be saved.
+
+    order : int
+        The number of words in each prefix.
+
+    dead_end_mode : str
+        The mode passed to close_chain(), an empty string keeps the dead ends.
+
+    clean_files : list
+        The files saved by clean_source(), used for the subreddit statistics.
+
+    stats_folder : str
+        Where the statistics will be exported, an empty string disables it.
+
+    """
+
+    word_dictionary = dict()
+
+    # The last words of everything merged so far.
+    previous_words = list()
+
+    for shard_file in shard_files:
+
+        with open(shard_file, "rb") as temp_file:
+            shard = pickle.load(temp_file)
+
+        # Only the prefixes that start in the previous shards are new. They come before
+        # the ones of this shard, so the outcomes keep the same order as in step2.py.
+        boundary_words = previous_words + shard["head"]
+
+        for index in range(len(previous_words)):
+            if index + order < len(boundary_words):
+                prefix = " ".join(boundary_words[index:index+order])
+                word_dictionary.setdefault(prefix, []).append(boundary_words[index+order])
+
+        for prefix, suffixes in shard["model"].items():
+            word_dictionary.setdefault(prefix, []).extend(suffixes)
+
+        previous_words = (previous_words + shard["tail"])[-order:]
+
+    # We remove the prefixes commonly used by other bots along with the outcomes that lead to them.
+    step2.remove_ignored_prefixes(word_dictionary)
+
+    # We export the statistics before closing the chain so they still show its dead ends.
+    if stats_folder:
+        export_stats(word_dictionary, clean_files, order, stats_folder)
+
+    # We remove the dead ends so the generator doesn't have to restart the chain.
+    if dead_end_mode:
+        step2.print_report(close_chain(word_dictionary, order, dead_end_mode))
+
+    with open(model_file, "wb") as temp_file:
+        pickle.dump(word_dictionary, temp_file)
+
+
+def export_stats(word_dictionary, clean_files, order, stats_folder):
+    """Exports the statistics of the merged model for model_stats.py.
+
+    Parameters
+    ----------
+    word_dictionary : dict
+        The merged model.
+
+    clean_files : list
+        The files saved by clean_source(), used for the subreddit statistics.
+
+    order : int
+        The number of words in each prefix.
+
+    stats_folder : str
+        Where the statistics will be saved.
+
+    """
+
+    subreddits = dict()
+
+    for clean_file in clean_files:
+
+        with open(clean_file, "r", encoding="utf-8") as temp_file:
+            clean_data = json.load(temp_file)
+
+        for name, values in clean_data["subreddits"].items():
+
+            subreddit = subreddits.setdefault(name, {"comments": 0, "words": 0, "vocabulary": set()})
+            subreddit["comments"] += values["comments"]
+            subreddit["words"] += values["words"]
+            subreddit["vocabulary"].update(values["vocabulary"])
+
+    export_model_stats(word_dictionary, order, stats_folder, subreddits or None)
+
+
+def get_source_id(kind, name):
+    """Returns the unique name used for the stages and work files of a source.
+
+    Parameters
+    ----------
+    kind : str
+        Either 'username', 'subreddit' or 'text'.
+
+    name : str
+        The username, subreddit or the location of the .txt file.
+
+    Returns
+    -------
+    str
+        The kind and name of the source, text files also get a hash of their full
+        path since different folders can have files with the same name.
+
+    """
+
+    if kind != "text":
+        return "{}_{}".format(kind, name)
+
+    path = os.path.normcase(os.path.abspath(name))
+    path_hash = hashlib.sha1(path.encode("utf-8")).hexdigest()[:8]
+
+    return "{}_{}_{}".format(kind, os.path.basename(name), path_hash)
+
+
+def run_in_process(process_pool, function, *args):
+    """Runs a function in the process pool and waits for it, used for CPU bound stages."""
+
+    return process_pool.submit(function, *args).result()
+
+
+def build_stages(config, process_pool):
+    """Creates the stages described by the config.
+
+    Parameters
+    ----------
+    config : dict
+        The parsed config file, see pipeline.json.
+
+    process_pool : concurrent.futures.ProcessPoolExecutor
+        Where the training shards run.
+
+    Returns
+    -------
+    list
+        The Stage objects.
+
+    """
+
+    work_folder = config["work_folder"]
+    order = config["order"]
+
+    for folder in ["downloads", "clean", "shards"]:
+        os.makedirs(os.path.join(work_folder, folder), exist_ok=True)
+
+    # The sources in the order step2.py and step2_alt.py would read them.
+    sources = [("username", name) for name in config.get("usernames", [])]
+    sources += [("subreddit", name) for name in config.get("subreddits", [])]
+
+    # step2.py reverses all the comments, so the last .csv file comes first.
+    sources.reverse()
+    sources += [("text", file_name) for file_name in config.get("text_files", [])]
+
+    download_max_age = config.get("download_max_age_hours")
+
+    if download_max_age is not None:
+        download_max_age *= 3600
+
+    stages = list()
+    shard_files = list()
+    clean_files = list()
+    source_ids = set()
+
+    for kind, name in sources:
+
+        source_id = get_source_id(kind, name)
+
+        # Two stages with the same name would silently replace each other.
+        if source_id in source_ids:
+            raise ValueError("The source {} is listed more than once.".format(name))
+
+        source_ids.add(source_id)
+        clean_file = os.path.join(work_folder, "clean", "{}.json".format(source_id))
+        shard_file = os.path.join(work_folder, "shards", "{}.pickle".format(source_id))
+        clean_dependencies = list()
+
+        if kind == "text":
+            source_file = name
+        else:
+            source_file = os.path.join(work_folder, "downloads", "{}.csv".format(source_id))
+            settings = {"name": name}
+
+            if kind == "subreddit":
+                settings["max_comments"] = config.get("max_comments", step1_alt.MAX_COMMENTS)
+
+            stages.append(Stage("download:" + source_id,
+                                lambda kind=kind, name=name, source_file=source_file:
+                                    download_source(kind, name, source_file),
+                                outputs=[source_file], settings=settings,
+                                max_age=download_max_age))
+
+            clean_dependencies.append("download:" + source_id)
+
+        allowed_subreddits = config.get("allowed_subreddits", [])
+
+        stages.append(Stage("clean:" + source_id,
+                            lambda kind=kind, source_file=source_file, clean_file=clean_file:
+                                clean_source(kind, source_file, clean_file, allowed_subreddits),
+                            dependencies=clean_dependencies, inputs=[source_file],
+                            outputs=[clean_file],
+                            settings={"allowed_subreddits": allowed_subreddits}))
+
+        stages.append(Stage("train:" + source_id,
+                            lambda clean_file=clean_file, shard_file=shard_file:
+                                run_in_process(process_pool, train_shard, clean_file, shard_file, order),
+                            dependencies=["clean:" + source_id], inputs=[clean_file],
+                            outputs=[shard_file], settings={"order": order}))
+
+        clean_files.append(clean_file)
+        shard_files.append(shard_file)
+
+    model_file = config.get("model_file", step2.RESULT_FILE)
+    dead_end_mode = config.get("dead_end_mode", step2.DEAD_END_MODE)
+    stats_folder = config.get("stats_folder", "")
+
+    merge_inputs = list(shard_files)
+    merge_outputs = [model_file]
+
+    # The statistics are exported by the merge stage, before the dead ends are removed.
+    if stats_folder:
+        merge_inputs += clean_files
+        merge_outputs.append(os.path.join(stats_folder, "metadata.json"))
+
+    stages.append(Stage("merge",
+                        lambda: merge_shards(shard_files, model_file, order, dead_end_mode,
+                                             clean_files, stats_folder),
+                        dependencies=[stage.name for stage in stages if stage.name.startswith("train:")],
+                        inputs=merge_inputs, outputs=merge_outputs,
+                        settings={"order": order, "dead_end_mode": dead_end_mode,
+                                  "stats_folder": stats_folder}))
+
+    return stages
+
+
+def init():
+    """Reads the config file and runs the pipeline."""
+
+    parser = argparse.ArgumentParser(description="Download, clean, train and export in one run.")
+    parser.add_argument("config", nargs="?", default="pipeline.json", help="The config file.")
+    parser.add_argument("--force", action="store_true", help="Run all stages even if they are up to date.")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as config_file:
+        config = json.load(config_file)
+
+    # step1_alt.py stops downloading after this number of comments.
+    step1_alt.MAX_COMMENTS = config.get("max_comments", step1_alt.MAX_COMMENTS)
+
+    workers = config.get("workers", 4)
+
+    with ProcessPoolExecutor(max_workers=workers) as process_pool:
+
+        stages = build_stages(config, process_pool)
+        failed_stages = run_stages(stages, os.path.join(config["work_folder"], STATE_FILE),
+                                   workers, args.force)
+
+    if failed_stages:
+        print("Failed stages:", ", ".join(failed_stages))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    init()
@@ -0,0 +1,241 @@
+"""
+A pool of pre-generated comments that a background thread keeps topped up between
+inbox checks, so a long running bot can reply without generating anything inline.
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+from markov import get_context_keywords
+
+# The minimum number of seconds the worker waits after a failed comment.
+FAILURE_DELAY = 1.0
+
+
+class ReplyPool:
+    """Keeps buckets of pre-generated comments, one for each top context keyword.
+
+    Comments in a keyword bucket were seeded with that keyword. The bucket with
+    the None key holds comments that start with a random sentence-start prefix and
+    is used for contexts without known keywords.
+
+    A bucket only holds as many comments as its context was requested, up to
+    bucket_size, so the worker doesn't spend time on keywords seen only once.
+
+    Parameters
+    ----------
+    chain : markov.MarkovChain
+        The chain used to generate the comments.
+
+    stop_words : set
+        The words that will be ignored from the contexts.
+
+    number_of_sentences : int
+        The maximum number of sentences of each comment.
+
+    number_of_candidates : int
+        The number of candidates generated for each pooled comment.
+
+    bucket_size : int
+        The maximum number of comments the worker keeps in each bucket.
+
+    max_buckets : int
+        The maximum number of keyword buckets, the least recently requested one is dropped first.
+
+    refill_interval : float
+        The number of seconds the worker waits after generating each comment.
+
+    """
+
+    def __init__(self, chain, stop_words, number_of_sentences, number_of_candidates,
+                 bucket_size=5, max_buckets=50, refill_interval=0.1):
+
+        self.chain = chain
+        self.stop_words = stop_words
+        self.number_of_sentences = number_of_sentences
+        self.number_of_candidates = number_of_candidates
+        self.bucket_size = bucket_size
+        self.max_buckets = max_buckets
+        self.refill_interval = refill_interval
+
+        self._buckets = OrderedDict({None: deque()})
+        self._targets = {None: 0}
+        self._lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._paused = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """Starts the background worker."""
+
+        self._stopped.clear()
+        self._worker = threading.Thread(target=self._refill, daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """Stops the background worker and waits for it to finish its current comment."""
+
+        self._stopped.set()
+        self._wake_up.set()
+
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def pause(self):
+        """Stops generating comments after the current one, until resume() is called.
+
+        We pause the worker while the bot replies, so it doesn't compete with the
+        comments generated inline.
+
+        """
+
+        self._paused.set()
+
+    def resume(self):
+        """Resumes the worker after pause()."""
+
+        self._paused.clear()
+        self._wake_up.set()
+
+    def get_bucket_key(self, context):
+        """Returns the keyword of the context with the highest IDF weight in the model.
+
+        Parameters
+        ----------
+        context : str
+            A sentence which will be separated into keywords.
+
+        Returns
+        -------
+        str
+            The top keyword or None if no keyword appears in the model.
+
+        """
+
+        _, weights = self.chain.get_context_index()
+        context_keywords = get_context_keywords(context, self.stop_words)
+
+        scored_keywords = [(weights[keyword] * frequency, keyword)
+                           for keyword, frequency in context_keywords.items() if keyword in weights]
+
+        if len(scored_keywords) == 0:
+            return None
+
+        return max(scored_keywords)[1]
+
+    def add_context(self, context):
+        """Creates the bucket of the given context or asks for one more comment in it.
+
+        Parameters
+        ----------
+        context : str
+            A sentence which will be separated into keywords.
+
+        Returns
+        -------
+        str
+            The key of the bucket.
+
+        """
+
+        key = self.get_bucket_key(context)
+
+        with self._lock:
+
+            if key in self._buckets:
+                self._buckets.move_to_end(key)
+                self._targets[key] = min(self._targets[key] + 1, self.bucket_size)
+            else:
+                self._buckets[key] = deque()
+                self._targets[key] = 1
+
+                # The random bucket is never dropped.
+                while len(self._buckets) > self.max_buckets + 1:
+                    oldest_key = next(iter(self._buckets))
+
+                    if oldest_key is None:
+                        self._buckets.move_to_end(None)
+                    else:
+                        del self._buckets[oldest_key]
+                        del self._targets[oldest_key]
+
+        self._wake_up.set()
+        return key
+
+    def get_reply(self, context):
+        """Returns a pre-generated comment for the given context.
+
+        Parameters
+        ----------
+        context : str
+            A sentence which will be separated into keywords.
+
+        Returns
+        -------
+        str
+            A comment from the matching bucket or None if it is empty, in that
+            case the bucket is created and the caller should generate the comment.
+
+        """
+
+        key = self.add_context(context)
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+
+            if bucket:
+                reply = bucket.popleft()
+            else:
+                reply = None
+
+        self._wake_up.set()
+        return reply
+
+    def _get_emptiest_bucket(self):
+        """Returns the key of the bucket missing the most comments or False if all are full."""
+
+        with self._lock:
+            key, missing = max(((key, self._targets[key] - len(bucket)) for key, bucket in self._buckets.items()),
+                               key=lambda item: item[1])
+
+        if missing < 1:
+            return False
+
+        return key
+
+    def _refill(self):
+        """Generates comments for the emptiest bucket until all of them are full."""
+
+        while not self._stopped.is_set():
+
+            key = False if self._paused.is_set() else self._get_emptiest_bucket()
+
+            if key is False:
+                # We sleep until a comment is taken, a bucket is created or the worker is resumed.
+                self._wake_up.wait()
+                self._wake_up.clear()
+                continue
+
+            # A failed comment must not stop the worker, otherwise the pool would never be refilled.
+            try:
+                if key is None:
+                    new_comment = self.chain.generate_comment(number_of_sentences=self.number_of_sentences,
+                                                              initial_prefix=self.chain.get_prefix_ids())
+                else:
+                    new_comment = self.chain.generate_best_comment(number_of_sentences=self.number_of_sentences,
+                                                                   context=key,
+                                                                   stop_words=self.stop_words,
+                                                                   number_of_candidates=self.number_of_candidates)
+            except Exception as error:
+                print("Failed to generate a pooled comment for:", key, error)
+                self._stopped.wait(max(self.refill_interval, FAILURE_DELAY))
+                continue
+
+            with self._lock:
+                # The bucket could have been dropped while we were generating.
+                if key in self._buckets:
+                    self._buckets[key].append(new_comment)
+
+            self._stopped.wait(self.refill_interval)
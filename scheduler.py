@@ -0,0 +1,304 @@
+"""
+Posts replies to a list of Reddit items while the next ones are being generated,
+waiting when the API rate limit is reached and retrying failed replies.
+"""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from prawcore.exceptions import Forbidden, NotFound, RequestException, ServerError, TooManyRequests
+
+    # Network and server problems usually go away, a forbidden or missing item doesn't.
+    TRANSIENT_ERRORS = (RequestException, ServerError, TooManyRequests, ConnectionError, TimeoutError)
+    PERMANENT_ERRORS = (Forbidden, NotFound)
+except ImportError:
+    TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+    PERMANENT_ERRORS = ()
+
+# The outcomes of post_reply().
+REPLIED = "replied"
+REJECTED = "rejected"
+FAILED = "failed"
+POSTPONED = "postponed"
+
+# Reddit rate limit messages look like: "Take a break for 5 minutes before trying again."
+# Short waits are given in milliseconds: "Take a break for 386 milliseconds before trying again."
+RATELIMIT_PATTERN = re.compile(r"(\d+)\s*(millisecond|second|minute)", re.IGNORECASE)
+
+
+def get_ratelimit_delay(exception):
+    """Returns the number of seconds Reddit asked us to wait, if the exception is a rate limit.
+
+    PRAW raises a RedditAPIException with one or more items, the rate limit ones
+    have the RATELIMIT error type. Any other object with the same attributes works.
+
+    Parameters
+    ----------
+    exception : Exception
+        The exception raised while replying.
+
+    Returns
+    -------
+    float
+        The number of seconds to wait or None if it is not a rate limit.
+
+    """
+
+    for item in getattr(exception, "items", []):
+
+        if getattr(item, "error_type", None) != "RATELIMIT":
+            continue
+
+        match = RATELIMIT_PATTERN.search(getattr(item, "message", ""))
+
+        if match is None:
+            return 60.0
+
+        seconds = float(match.group(1))
+        unit = match.group(2).lower()
+
+        if unit == "minute":
+            seconds *= 60
+        elif unit == "millisecond":
+            seconds /= 1000
+
+        return seconds
+
+    return None
+
+
+class ReplyScheduler:
+    """Generates replies in background threads and posts them in order.
+
+    Parameters
+    ----------
+    generate_reply : callable
+        Takes an item and returns the text of its reply.
+
+    get_limits : callable
+        Returns a dictionary with the 'remaining' requests and the 'reset_timestamp'
+        of the current rate limit window, like praw.Reddit.auth.limits.
+        None disables the check.
+
+    on_success : callable
+        Called with each item after it was replied.
+
+    on_rejected : callable
+        Called with each item Reddit won't accept a reply for, such as deleted
+        or locked comments, so it can be skipped in the next runs.
+
+    max_retries : int
+        The number of times a reply is retried after a rate limit or a network
+        or server error before moving on. Other errors are not retried.
+
+    backoff : float
+        The number of seconds to wait after the first failure, it doubles after each retry.
+
+    max_run_time : float
+        The number of seconds run() can take. Once a wait would go past it the
+        remaining items are left for the next run. None never stops.
+
+    generation_workers : int
+        The number of threads that generate replies.
+
+    sleep : callable
+        The function used to wait, it can be replaced to run without delays.
+
+    clock : callable
+        Returns the current timestamp, it is replaced along with sleep.
+
+    """
+
+    def __init__(self, generate_reply, get_limits=None, on_success=None, on_rejected=None,
+                 max_retries=3, backoff=5.0, max_run_time=None, generation_workers=1,
+                 sleep=time.sleep, clock=time.time):
+
+        self.generate_reply = generate_reply
+        self.get_limits = get_limits
+        self.on_success = on_success
+        self.on_rejected = on_rejected
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_run_time = max_run_time
+        self.generation_workers = generation_workers
+        self.sleep = sleep
+        self.clock = clock
+
+        # The time when run() has to stop, set at the start of each run.
+        self.deadline = None
+
+    def wait(self, seconds):
+        """Sleeps the given seconds unless that would go past the deadline.
+
+        Parameters
+        ----------
+        seconds : float
+            The number of seconds to wait.
+
+        Returns
+        -------
+        bool
+            Whether we waited, False means the run has to stop.
+
+        """
+
+        if self.deadline is not None and self.clock() + seconds > self.deadline:
+            return False
+
+        self.sleep(seconds)
+        return True
+
+    def wait_for_rate_limit(self):
+        """Sleeps until the rate limit window resets if we don't have requests left.
+
+        Returns
+        -------
+        bool
+            False if the wait would go past the deadline.
+
+        """
+
+        if self.get_limits is None:
+            return True
+
+        limits = self.get_limits()
+        remaining = limits.get("remaining")
+        reset_timestamp = limits.get("reset_timestamp")
+
+        if remaining is None or reset_timestamp is None or remaining >= 1:
+            return True
+
+        delay = reset_timestamp - self.clock()
+
+        if delay <= 0:
+            return True
+
+        print("Rate limit reached, waiting {:.0f} seconds.".format(delay))
+        return self.wait(delay)
+
+    def post_reply(self, item, reply):
+        """Replies to an item, retrying rate limits and transient errors with exponential backoff.
+
+        Parameters
+        ----------
+        item : praw.models.Comment
+            Any object with a reply() method.
+
+        reply : str
+            The text of the reply.
+
+        Returns
+        -------
+        str
+            REPLIED, REJECTED if Reddit won't accept it, FAILED if it can be tried
+            again in another run or POSTPONED if we ran out of time.
+
+        """
+
+        delay = self.backoff
+
+        for attempt in range(self.max_retries + 1):
+
+            if not self.wait_for_rate_limit():
+                return POSTPONED
+
+            try:
+                item.reply(reply)
+                return REPLIED
+            except Exception as error:
+
+                # Reddit tells us how long to wait.
+                ratelimit_delay = get_ratelimit_delay(error)
+
+                # Other API errors, like a deleted comment or a locked thread, won't change.
+                if ratelimit_delay is None and (getattr(error, "items", None) or
+                                                isinstance(error, PERMANENT_ERRORS)):
+                    print("Reply rejected for:", item.id, error)
+                    return REJECTED
+
+                if ratelimit_delay is None and not isinstance(error, TRANSIENT_ERRORS):
+                    print("Failed to reply to:", item.id, error)
+                    return FAILED
+
+                if attempt == self.max_retries:
+                    print("Failed to reply to:", item.id, error)
+                    return FAILED
+
+                if ratelimit_delay is None:
+                    ratelimit_delay = delay
+                    delay *= 2
+
+                if not self.wait(ratelimit_delay):
+                    return POSTPONED
+
+        return FAILED
+
+    def run(self, items):
+        """Generates and posts the replies of all items.
+
+        Replies are generated in order by the worker threads while the previous
+        ones are being posted. A failed item doesn't stop the others, running out
+        of time stops the run and the remaining items count as failed.
+
+        Parameters
+        ----------
+        items : list
+            The items to reply to.
+
+        Returns
+        -------
+        tuple
+            The lists of replied and failed items.
+
+        """
+
+        replied_items = list()
+        failed_items = list()
+
+        if self.max_run_time is None:
+            self.deadline = None
+        else:
+            self.deadline = self.clock() + self.max_run_time
+
+        with ThreadPoolExecutor(max_workers=self.generation_workers) as executor:
+
+            futures = [executor.submit(self.generate_reply, item) for item in items]
+
+            for index, (item, future) in enumerate(zip(items, futures)):
+
+                if self.deadline is not None and self.clock() >= self.deadline:
+                    outcome = POSTPONED
+                else:
+                    try:
+                        reply = future.result()
+                    except Exception as error:
+                        print("Failed to generate a reply for:", item.id, error)
+                        failed_items.append(item)
+                        continue
+
+                    outcome = self.post_reply(item, reply)
+
+                if outcome == POSTPONED:
+                    print("Out of time, leaving {} replies for the next run.".format(len(items) - index))
+                    failed_items.extend(items[index:])
+
+                    # We don't need the replies that weren't generated yet.
+                    for pending_future in futures[index:]:
+                        pending_future.cancel()
+
+                    break
+
+                if outcome == REPLIED:
+                    replied_items.append(item)
+
+                    if self.on_success is not None:
+                        self.on_success(item)
+                else:
+                    failed_items.append(item)
+
+                    if outcome == REJECTED and self.on_rejected is not None:
+                        self.on_rejected(item)
+
+        return (replied_items, failed_items)
@@ -34,7 +34,7 @@ def init():
         COMMENTS_LIST.clear()
 
 
-def load_comments(username, latest_timestamp=None):
+def load_comments(username, latest_timestamp=None, comments_list=COMMENTS_LIST):
     """
     Downloads the username comments, 500 at a time.
 
@@ -46,6 +46,9 @@ def load_comments(username, latest_timestamp=None):
     latest_timestamp : int
         The latest comment timestamp.
 
+    comments_list : list
+        Where the comments are added, the global list by default.
+
     """
 
     base_url = "https://api.pushshift.io/reddit/comment/search/"
@@ -79,14 +82,14 @@ def load_comments(username, latest_timestamp=None):
             body = item["body"].replace("&gt;", ">").replace(
                 "&lt;", "<").replace("&amp;#x200B", " ")
 
-            COMMENTS_LIST.append(
+            comments_list.append(
                 [iso_date, subreddit, body])
 
         if total_posts < 500:
             print("No more results.")
         else:
             time.sleep(1.2)
-            load_comments(username, latest_timestamp)
+            load_comments(username, latest_timestamp, comments_list)
 
 
 if __name__ == "__main__":
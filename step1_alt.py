@@ -37,7 +37,7 @@ def init():
         COMMENTS_LIST.clear()
 
 
-def load_comments(subreddit, latest_timestamp=None):
+def load_comments(subreddit, latest_timestamp=None, comments_list=COMMENTS_LIST):
     """
     Downloads the subreddit comments, 500 at a time.
 
@@ -49,6 +49,9 @@ def load_comments(subreddit, latest_timestamp=None):
     latest_timestamp : int
         The latest comment timestamp.
 
+    comments_list : list
+        Where the comments are added, the global list by default.
+
     """
 
     base_url = "https://api.pushshift.io/reddit/comment/search/"
@@ -82,16 +85,16 @@ def load_comments(subreddit, latest_timestamp=None):
             body = item["body"].replace("&gt;", ">").replace(
                 "&lt;", "<").replace("&amp;#x200B", " ")
 
-            COMMENTS_LIST.append(
+            comments_list.append(
                 [iso_date, subreddit, body])
 
         if total_posts < 500:
             print("No more results.")
-        elif len(COMMENTS_LIST) >= MAX_COMMENTS:
+        elif len(comments_list) >= MAX_COMMENTS:
             print("Download complete.")
         else:
             time.sleep(1.2)
-            load_comments(subreddit, latest_timestamp)
+            load_comments(subreddit, latest_timestamp, comments_list)
 
 
 if __name__ == "__main__":
@@ -5,9 +5,18 @@ into the training model.
 
 import csv
 import pickle
+import re
+from itertools import islice
+
+from markov import IGNORED_PREFIX_PATTERNS, close_chain, find_predecessors, prune_dead_ends
+from model_stats import export_model_stats
+from vocabulary import Vocabulary
 
 RESULT_FILE = "model.pickle"
 
+# A folder where the model statistics will be exported for model_stats.py. An empty string disables it.
+STATS_FOLDER = ""
+
 # The csv files you want to fit your training model.
 CSV_FILES = ["username_1.csv", "username_2.csv"]
 
@@ -17,6 +26,11 @@ ALLOWED_SUBREDDITS = []
 # The order (memory length in words) you need. 1 or 2 are the most common options.
 ORDER = 2
 
+# What to do with outcomes that lead to prefixes that are not in the model.
+# 'relink' fills them with lower order outcomes, 'prune' removes them and an empty string keeps them.
+# Since all the text is joined into one stream there are usually very few of them, so we keep them by default.
+DEAD_END_MODE = ""
+
 
 def init():
     """Reads the specified .csv file(s) and creates a training model from them.   
@@ -26,61 +40,193 @@ def init():
 
     word_dictionary = dict()
     comments_list = list()
+    subreddits = dict()
 
     for csv_file in CSV_FILES:
+        comments_list.extend(read_comments(csv_file, ALLOWED_SUBREDDITS,
+                                           subreddits if STATS_FOLDER else None))
 
-        # We iterate the .csv row by row.
-        for row in csv.DictReader(open(csv_file, "r", encoding="utf-8")):
+    # We place the comments in their original order and separate each one into words.
+    comments_list.reverse()
+    words_list = " ".join(comments_list).split()
 
-            # We skip empty comments.
-            if len(row["body"]) == 0:
-                continue
+    add_transitions(word_dictionary, words_list, ORDER)
 
-            # Remove unnecessary whitespaces.
-            row["body"] = row["body"].strip()
+    # We remove the prefixes commonly used by other bots along with the outcomes that lead to them.
+    remove_ignored_prefixes(word_dictionary)
 
-            # To improve results we ensure all comments end with a period.
-            ends_with_punctuation = False
+    # We export the statistics before closing the chain so they still show its dead ends.
+    if STATS_FOLDER:
+        export_model_stats(word_dictionary, ORDER, STATS_FOLDER, subreddits)
 
-            for char in [".", "?", "!"]:
+    # We remove the dead ends so the generator doesn't have to restart the chain.
+    if DEAD_END_MODE:
+        print_report(close_chain(word_dictionary, ORDER, DEAD_END_MODE))
 
-                if row["body"][-1] == char:
-                    ends_with_punctuation = True
-                    break
+    # We save the dict as a pickle so we can reuse it on the bot script.
+    with open("./{}".format(RESULT_FILE), "wb") as model_file:
+        pickle.dump(word_dictionary, model_file)
 
-            if not ends_with_punctuation:
-                row["body"] += "."
 
-            if len(ALLOWED_SUBREDDITS) == 0:
-                comments_list.append(row["body"])
-            else:
-                # We check if the subreddit comment is in our allowed subreddits list.
-                if row["subreddit"].lower() in ALLOWED_SUBREDDITS:
-                    comments_list.append(row["body"])
+def read_comments(csv_file, allowed_subreddits, subreddits=None):
+    """Reads the comments of a .csv file and applies some light clean up.
 
-    # We place the comments in their original order and separate each one into words.
-    comments_list.reverse()
-    words_list = " ".join(comments_list).split()
+    Parameters
+    ----------
+    csv_file : str
+        The location of the .csv file.
 
-    for index, _ in enumerate(words_list):
+    allowed_subreddits : list
+        The subreddits comments to keep (lowercase). An empty list will allow all.
 
-        # This will always fail in the last word since it doesn't have anything to pair it with.
-        try:
-            prefix = " ".join(words_list[index:index+ORDER])
-            suffix = words_list[index+ORDER]
+    subreddits : dict
+        Optional, where the number of comments, words and unique words of each subreddit are counted.
 
-            # If the word is not in the dictionary, we init it with the next word.
-            if prefix not in word_dictionary.keys():
-                word_dictionary[prefix] = list([suffix])
-            else:
-                # Otherwise we append it to its inner list of outcomes.
-                word_dictionary[prefix].append(suffix)
-        except:
-            pass
+    Returns
+    -------
+    list
+        The cleaned comments in the same order as the file.
 
-    # We save the dict as a pickle so we can reuse it on the bot script.
-    with open("./{}".format(RESULT_FILE), "wb") as model_file:
-        pickle.dump(word_dictionary, model_file)
+    """
+
+    comments_list = list()
+
+    # We iterate the .csv row by row.
+    for row in csv.DictReader(open(csv_file, "r", encoding="utf-8")):
+
+        # We skip empty comments.
+        if len(row["body"]) == 0:
+            continue
+
+        # Remove unnecessary whitespaces.
+        row["body"] = row["body"].strip()
+
+        # To improve results we ensure all comments end with a period.
+        ends_with_punctuation = False
+
+        for char in [".", "?", "!"]:
+
+            if row["body"][-1] == char:
+                ends_with_punctuation = True
+                break
+
+        if not ends_with_punctuation:
+            row["body"] += "."
+
+        # We check if the subreddit comment is in our allowed subreddits list.
+        if len(allowed_subreddits) > 0 and row["subreddit"].lower() not in allowed_subreddits:
+            continue
+
+        comments_list.append(row["body"])
+
+        if subreddits is not None:
+            # We count the comments, words and unique words of each subreddit.
+            subreddit = subreddits.setdefault(row["subreddit"].lower(),
+                                              {"comments": 0, "words": 0, "vocabulary": set()})
+
+            words = row["body"].split()
+            subreddit["comments"] += 1
+            subreddit["words"] += len(words)
+            subreddit["vocabulary"].update(words)
+
+    return comments_list
+
+
+def add_transitions(word_dictionary, words_list, order):
+    """Adds every prefix of the given words and the word that follows it to the model.
+
+    Parameters
+    ----------
+    word_dictionary : dict
+        The model, it is modified in place.
+
+    words_list : list
+        The words in their original order.
+
+    order : int
+        The number of words in each prefix.
+
+    """
+
+    # Each word is converted to an id once, every prefix is then a tuple of ids instead of a new string.
+    vocabulary = Vocabulary()
+    word_ids = vocabulary.encode(words_list)
+    words = vocabulary.words
+
+    transitions = dict()
+    prefixes = zip(*[islice(word_ids, position, None) for position in range(order)])
+
+    for prefix_ids, suffix_id in zip(prefixes, islice(word_ids, order, None)):
+
+        suffixes = transitions.get(prefix_ids)
+
+        # All the outcomes share the vocabulary strings, so the pickle stores each word once.
+        if suffixes is None:
+            transitions[prefix_ids] = [words[suffix_id]]
+        else:
+            suffixes.append(words[suffix_id])
+
+    # The prefix strings are only built once for each unique prefix.
+    for prefix_ids, suffixes in transitions.items():
+
+        prefix = vocabulary.decode(prefix_ids)
+
+        # If the prefix is not in the dictionary, we init it with its outcomes.
+        if prefix not in word_dictionary:
+            word_dictionary[prefix] = suffixes
+        else:
+            # Otherwise we append them to its inner list of outcomes.
+            word_dictionary[prefix].extend(suffixes)
+
+
+def remove_ignored_prefixes(word_dictionary):
+    """Removes the prefixes that are commonly used by other bots and the outcomes that lead to them.
+
+    Only the prefixes that can move to a removed one are checked for new dead ends,
+    so this is much cheaper than a full close_chain() pass.
+
+    Parameters
+    ----------
+    word_dictionary : dict
+        The model, it is modified in place.
+
+    Returns
+    -------
+    int
+        The number of removed prefixes.
+
+    """
+
+    ignored_prefix = re.compile("|".join(map(re.escape, IGNORED_PREFIX_PATTERNS)))
+    ignored_prefixes = [prefix for prefix in word_dictionary if ignored_prefix.search(prefix)]
+
+    for prefix in ignored_prefixes:
+        del word_dictionary[prefix]
+
+    if ignored_prefixes:
+        prune_dead_ends(word_dictionary, find_predecessors(word_dictionary, ignored_prefixes))
+
+    return len(ignored_prefixes)
+
+
+def print_report(report):
+    """Prints the reachability report returned by close_chain().
+
+    Parameters
+    ----------
+    report : dict
+        The dead ends report.
+
+    """
+
+    print("Prefixes: {} before, {} after".format(
+        report["prefixes_before"], report["prefixes_after"]))
+    print("Dead states:", report["dead_states_before"])
+    print("Relinked states:", report["relinked_states"])
+    print("Pruned outcomes: {} ({} prefixes removed)".format(
+        report["pruned_suffixes"], report["removed_prefixes"]))
+    print("Reachable transitions: {:.2%} before, {:.2%} after".format(
+        report["reachability_before"], report["reachability_after"]))
 
 
 if __name__ == "__main__":
@@ -6,14 +6,26 @@ into the training model.
 import csv
 import pickle
 
+from markov import close_chain
+from model_stats import export_model_stats
+from step2 import add_transitions, print_report, remove_ignored_prefixes
+
 RESULT_FILE = "model.pickle"
 
+# A folder where the model statistics will be exported for model_stats.py. An empty string disables it.
+STATS_FOLDER = ""
+
 # The txt files you want to fit your training model.
 TXT_FILES = ["file1.txt", "file2.txt"]
 
 # The order (memory length in words) you need. 1 or 2 are the most common options.
 ORDER = 2
 
+# What to do with outcomes that lead to prefixes that are not in the model.
+# 'relink' fills them with lower order outcomes, 'prune' removes them and an empty string keeps them.
+# Since all the text is joined into one stream there are usually very few of them, so we keep them by default.
+DEAD_END_MODE = ""
+
 
 def init():
     """Reads the specified .txt file(s) and creates a training model from them.   
@@ -33,21 +45,18 @@ def init():
     # We separate each comment into words.
     words_list = " ".join(texts_list).split()
 
-    for index, _ in enumerate(words_list):
-
-        # This will always fail in the last word since it doesn't have anything to pair it with.
-        try:
-            prefix = " ".join(words_list[index:index+ORDER])
-            suffix = words_list[index+ORDER]
-
-            # If the word is not in the dictionary, we init it with the next word.
-            if prefix not in word_dictionary.keys():
-                word_dictionary[prefix] = list([suffix])
-            else:
-                # Otherwise we append it to its inner list of outcomes.
-                word_dictionary[prefix].append(suffix)
-        except:
-            pass
+    add_transitions(word_dictionary, words_list, ORDER)
+
+    # We remove the prefixes commonly used by other bots along with the outcomes that lead to them.
+    remove_ignored_prefixes(word_dictionary)
+
+    # We export the statistics before closing the chain so they still show its dead ends.
+    if STATS_FOLDER:
+        export_model_stats(word_dictionary, ORDER, STATS_FOLDER)
+
+    # We remove the dead ends so the generator doesn't have to restart the chain.
+    if DEAD_END_MODE:
+        print_report(close_chain(word_dictionary, ORDER, DEAD_END_MODE))
 
     # We save the dict as a pickle so we can reuse it on other scripts.
     with open("./{}".format(RESULT_FILE), "wb") as model_file:
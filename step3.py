@@ -3,11 +3,15 @@ A script that generates sentences using Markov chains.
 """
 
 import pickle
-import random
+
+from markov import MarkovChain
 
 
 MODEL_FILE = "./model.pickle"
 
+# The order (memory length in words) of the model, this must match the order number in step2.py
+ORDER = 2
+
 # The stop words files.
 ES_STOPWORDS_FILE = "./assets/stopwords-es.txt"
 EN_STOPWORDS_FILE = "./assets/stopwords-en.txt"
@@ -48,23 +52,19 @@ def init():
     # Complete our stop words set.
     add_extra_words()
 
-    model = read_model(MODEL_FILE)
-    model_keys = list(model.keys())
+    chain = MarkovChain(read_model(MODEL_FILE), order=ORDER)
 
     # Basic random.
-    new_comment = generate_comment(model=model, order=2,
-                                   number_of_sentences=2,
-                                   initial_prefix=random.choice(model_keys))
+    new_comment = chain.generate_comment(number_of_sentences=2,
+                                         initial_prefix=chain.get_random_prefix())
 
     # Selective random.
-    new_comment = generate_comment(model=model, order=2,
-                                   number_of_sentences=2,
-                                   initial_prefix=get_prefix(model_keys))
+    new_comment = chain.generate_comment(number_of_sentences=2,
+                                         initial_prefix=chain.get_prefix())
 
     # Context-aware.
-    new_comment = generate_comment(model=model, order=2,
-                                   number_of_sentences=2,
-                                   initial_prefix=get_prefix_with_context(model, "Agent_Phantom"))
+    new_comment = chain.generate_comment(number_of_sentences=2,
+                                         initial_prefix=chain.get_prefix_with_context("Agent_Phantom", STOP_WORDS))
 
     print(new_comment)
 
@@ -88,150 +88,6 @@ def read_model(file_name):
         return pickle.load(model_file)
 
 
-def get_prefix(model_keys):
-    """Get a random prefix that starts in uppercase.
-
-    Parameters
-    ----------
-    model_keys : list
-        A list containing all the model keys.
-
-    Returns
-    -------
-    str
-        The randomly selected prefix.
-
-    """
-
-    # We give it a maximum of 10,000 tries.
-    for _ in range(10000):
-
-        random_prefix = random.choice(model_keys)
-
-        if random_prefix[0].isupper():
-
-            ends_with_punctuation = False
-            stripped_suffix = random_prefix.strip()
-
-            for char in [".", "?", "!"]:
-                if stripped_suffix[-1] == char:
-                    ends_with_punctuation = True
-                    break
-
-            if not ends_with_punctuation:
-                break
-
-    return random_prefix
-
-
-def get_prefix_with_context(model, context):
-    """Get a random prefix that matches the given context.
-
-    Parameters
-    ----------
-    model : dict
-        The dictionary containing all the pairs and their possible outcomes.
-
-    context : str
-        A sentence which will be separated into keywords.
-
-    Returns
-    -------
-    str
-        The randomly selected context-aware prefix.
-
-    """
-
-    model_keys = list(model.keys())
-
-    # Some light cleanup.
-    context = context.replace("?", "").replace("!", "").replace(".", "")
-    context_keywords = list(set(context.split()))
-
-    # we remove stop words from the context.
-    # We use reversed() to remove items from the list without affecting the sequence.
-    for word in reversed(context_keywords):
-
-        if len(word) <= 3 or word in STOP_WORDS:
-            context_keywords.remove(word)
-
-    # If our context has no keywords left we return a random prefix.
-    if len(context_keywords) == 0:
-        return get_prefix(model_keys)
-
-    # We are going to sample one prefix for each available keyword and return only one.
-    random.shuffle(model_keys)
-    sampled_prefixes = list()
-
-    for word in context_keywords:
-
-        for prefix in model_keys:
-
-            if word in prefix or word.lower() in prefix or word.title() in prefix:
-
-                if "?" not in prefix or "!" not in prefix or "." not in prefix:
-                    sampled_prefixes.append(prefix)
-                    break
-
-    # If we don't get any samples we fallback to the random prefix method.
-    if len(sampled_prefixes) == 0:
-        return get_prefix(model_keys)
-    else:
-        return random.choice(sampled_prefixes)
-
-
-def generate_comment(model, number_of_sentences, initial_prefix, order):
-    """Generates a new comment using the model and an initial prefix.
-
-    Parameters
-    ----------
-    model : dict
-        The dictionary containing all the pairs and their possible outcomes.
-
-    number_of_Sentences : int
-        The maximum number of sentences.
-
-    initial_prefix : str
-        The word(s) that will start the chain.
-
-    order : int
-        The number of words in the state, this must match the order number in step2.py
-
-    Returns
-    -------
-    str
-        The newly generated text.
-
-    """
-
-    model_keys = list(model.keys())
-    counter = 0
-    latest_suffix = initial_prefix
-    final_sentence = latest_suffix + " "
-
-    # We add a maximum sentence length to avoid going infinite in edge cases.
-    for _ in range(500):
-
-        try:
-            latest_suffix = random.choice(model[latest_suffix])
-        except:
-            # If we don't get another word we take another one randomly and continue the chain.
-            latest_suffix = get_prefix(model_keys)
-
-        final_sentence += latest_suffix + " "
-        latest_suffix = " ".join(final_sentence.split()[-order:]).strip()
-
-        for char in [".", "?", "!"]:
-            if latest_suffix[-1] == char:
-                counter += 1
-                break
-
-        if counter >= number_of_sentences:
-            break
-
-    return final_sentence
-
-
 if __name__ == "__main__":
 
     init()
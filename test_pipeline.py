@@ -0,0 +1,122 @@
+"""
+Tests for pipeline.py, run with:
+
+    python -m unittest test_pipeline
+"""
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import pipeline
+import step2
+
+
+TEXTS = ["The cat sat on the mat. The dog sat too.",
+         "Short.",
+         "on the",
+         "The dog ran to the cat and the cat ran away. The end."]
+
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.folder)
+
+    def write_text(self, file_name, text):
+
+        file_name = os.path.join(self.folder, file_name)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+
+        with open(file_name, "w", encoding="utf-8") as temp_file:
+            temp_file.write(text)
+
+        return file_name
+
+    def train_shards(self, texts, order):
+
+        shard_files = list()
+
+        for number, text in enumerate(texts):
+
+            clean_file = os.path.join(self.folder, "clean_{}.json".format(number))
+            shard_file = os.path.join(self.folder, "shard_{}.pickle".format(number))
+
+            with open(clean_file, "w", encoding="utf-8") as temp_file:
+                json.dump({"kind": "text", "comments": [text], "subreddits": {}}, temp_file)
+
+            pipeline.train_shard(clean_file, shard_file, order)
+            shard_files.append(shard_file)
+
+        return shard_files
+
+    def get_expected_model(self, texts, order):
+        """The model step2.py builds from the same texts."""
+
+        word_dictionary = dict()
+        step2.add_transitions(word_dictionary, " ".join(texts).split(), order)
+
+        return word_dictionary
+
+    def read_model(self, model_file):
+
+        with open(model_file, "rb") as temp_file:
+            return pickle.load(temp_file)
+
+    def test_merge_adds_the_boundary_transitions(self):
+
+        # Some shards are shorter than the order, so a transition can cross several of them.
+        for order in [1, 2, 3]:
+
+            model_file = os.path.join(self.folder, "model.pickle")
+            pipeline.merge_shards(self.train_shards(TEXTS, order), model_file, order, "")
+
+            self.assertEqual(self.read_model(model_file), self.get_expected_model(TEXTS, order))
+
+    def test_merge_keeps_the_order_of_the_outcomes(self):
+
+        model_file = os.path.join(self.folder, "model.pickle")
+        pipeline.merge_shards(self.train_shards(TEXTS, 2), model_file, 2, "")
+
+        self.assertEqual(list(self.read_model(model_file).items()),
+                         list(self.get_expected_model(TEXTS, 2).items()))
+
+    def test_same_file_names_in_different_folders(self):
+
+        text_files = [self.write_text(os.path.join("a", "t.txt"), "one two three four."),
+                      self.write_text(os.path.join("b", "t.txt"), "five six seven eight.")]
+
+        config = {"work_folder": os.path.join(self.folder, "work"), "text_files": text_files,
+                  "order": 2, "model_file": os.path.join(self.folder, "model.pickle")}
+
+        with ProcessPoolExecutor(max_workers=2) as process_pool:
+            stages = pipeline.build_stages(config, process_pool)
+            failed_stages = pipeline.run_stages(stages, os.path.join(self.folder, "state.json"), 2)
+
+        self.assertEqual(failed_stages, [])
+        self.assertEqual(len(set(stage.name for stage in stages)), len(stages))
+        self.assertEqual(self.read_model(config["model_file"]),
+                         self.get_expected_model(["one two three four.", "five six seven eight."], 2))
+
+    def test_duplicated_sources_are_rejected(self):
+
+        text_file = self.write_text("t.txt", "one two three.")
+        config = {"work_folder": os.path.join(self.folder, "work"), "order": 2,
+                  "text_files": [text_file, os.path.join(self.folder, ".", "t.txt")]}
+
+        with self.assertRaises(ValueError):
+            pipeline.build_stages(config, None)
+
+
+if __name__ == "__main__":
+
+    unittest.main()
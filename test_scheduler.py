@@ -0,0 +1,280 @@
+"""
+Tests for scheduler.py against a local fake of the PRAW rate limits, run with:
+
+    python -m unittest test_scheduler
+"""
+
+import unittest
+
+from scheduler import ReplyScheduler, get_ratelimit_delay
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps."""
+
+    def __init__(self):
+
+        self.now = 1000000.0
+        self.sleeps = list()
+
+    def time(self):
+
+        return self.now
+
+    def sleep(self, seconds):
+
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeErrorItem:
+    """An item of a RedditAPIException."""
+
+    def __init__(self, error_type, message):
+
+        self.error_type = error_type
+        self.message = message
+
+
+class FakeAPIException(Exception):
+    """Behaves like praw.exceptions.RedditAPIException."""
+
+    def __init__(self, error_type, message):
+
+        super().__init__(message)
+        self.items = [FakeErrorItem(error_type, message)]
+
+
+class FakeReddit:
+    """Allows `window_size` replies every `window_seconds`, like the Reddit API.
+
+    A reply sent without requests left fails with a RATELIMIT error, the same way
+    Reddit answers when a client ignores its rate limit headers.
+    """
+
+    def __init__(self, clock, window_size=12, window_seconds=600, ratelimit_message=None):
+
+        self.clock = clock
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.ratelimit_message = ratelimit_message or "Take a break for 386 milliseconds before trying again."
+
+        self.reset_timestamp = clock.time() + window_seconds
+        self.remaining = window_size
+        self.replies = list()
+        self.rejected_replies = 0
+
+    def update_window(self):
+
+        if self.clock.time() >= self.reset_timestamp:
+            self.reset_timestamp = self.clock.time() + self.window_seconds
+            self.remaining = self.window_size
+
+    @property
+    def limits(self):
+        """The same dictionary as praw.Reddit.auth.limits."""
+
+        self.update_window()
+        return {"remaining": self.remaining, "reset_timestamp": self.reset_timestamp, "used": 0}
+
+    def reply(self, comment_id, text):
+
+        self.update_window()
+
+        if self.remaining < 1:
+            self.rejected_replies += 1
+            raise FakeAPIException("RATELIMIT", self.ratelimit_message)
+
+        self.remaining -= 1
+        self.replies.append((comment_id, text))
+
+
+class FakeComment:
+    """A mention in the inbox."""
+
+    def __init__(self, reddit, comment_id):
+
+        self.reddit = reddit
+        self.id = comment_id
+        self.body = "Mention number {}".format(comment_id)
+
+    def reply(self, text):
+
+        self.reddit.reply(self.id, text)
+
+
+class GetRatelimitDelayTest(unittest.TestCase):
+
+    def get_delay(self, message):
+
+        return get_ratelimit_delay(FakeAPIException("RATELIMIT", message))
+
+    def test_units(self):
+
+        self.assertEqual(self.get_delay("Take a break for 386 milliseconds before trying again."), 0.386)
+        self.assertEqual(self.get_delay("Take a break for 12 seconds before trying again."), 12)
+        self.assertEqual(self.get_delay("Take a break for 5 minutes before trying again."), 300)
+
+    def test_unknown_message(self):
+
+        self.assertEqual(self.get_delay("You are doing that too much."), 60)
+
+    def test_other_errors(self):
+
+        self.assertIsNone(get_ratelimit_delay(FakeAPIException("THREAD_LOCKED", "Locked.")))
+        self.assertIsNone(get_ratelimit_delay(ValueError("Not an API error.")))
+
+
+class ReplySchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.clock = FakeClock()
+        self.reddit = FakeReddit(self.clock)
+        self.mentions = [FakeComment(self.reddit, "c{}".format(number)) for number in range(100)]
+
+    def make_scheduler(self, **kwargs):
+
+        return ReplyScheduler(generate_reply=lambda comment: "Reply to " + comment.id,
+                              sleep=self.clock.sleep, clock=self.clock.time, **kwargs)
+
+    def test_burst_waits_for_each_window(self):
+
+        replied_items, failed_items = self.make_scheduler(get_limits=lambda: self.reddit.limits).run(self.mentions)
+
+        self.assertEqual(len(replied_items), 100)
+        self.assertEqual(failed_items, [])
+        self.assertEqual(self.reddit.rejected_replies, 0)
+
+        # The replies are posted in the same order as the mentions.
+        self.assertEqual([comment_id for comment_id, _ in self.reddit.replies],
+                         [comment.id for comment in self.mentions])
+
+        # 100 replies in windows of 12 need 8 waits.
+        self.assertEqual(len(self.clock.sleeps), 8)
+
+    def test_burst_without_limits_uses_the_error_delay(self):
+
+        # The windows are shorter than the delay Reddit asks for.
+        self.reddit.window_seconds = 0.3
+        self.reddit.reset_timestamp = self.clock.time() + 0.3
+
+        replied_items, failed_items = self.make_scheduler(max_retries=1).run(self.mentions)
+
+        self.assertEqual(len(replied_items), 100)
+        self.assertEqual(failed_items, [])
+        self.assertEqual(self.reddit.rejected_replies, 8)
+        self.assertEqual(self.clock.sleeps, [0.386] * 8)
+
+    def test_failures_dont_stop_the_burst(self):
+
+        def generate_reply(comment):
+
+            if comment.id == "c3":
+                raise RuntimeError("Generation failed.")
+
+            return "Reply to " + comment.id
+
+        self.reddit.ratelimit_message = "Take a break for 5 minutes before trying again."
+        self.reddit.remaining = 50
+
+        scheduler = ReplyScheduler(generate_reply=generate_reply, max_retries=0,
+                                   sleep=self.clock.sleep, clock=self.clock.time)
+        replied_items, failed_items = scheduler.run(self.mentions)
+
+        # Without retries the replies sent after the window is used are lost.
+        self.assertEqual(len(replied_items), 50)
+        self.assertEqual(len(failed_items), 50)
+        self.assertIn(self.mentions[3], failed_items)
+
+    def test_on_success_is_called_once_per_reply(self):
+
+        logged_ids = list()
+
+        self.make_scheduler(get_limits=lambda: self.reddit.limits,
+                            on_success=lambda comment: logged_ids.append(comment.id)).run(self.mentions)
+
+        self.assertEqual(logged_ids, [comment.id for comment in self.mentions])
+
+    def test_permanent_errors_are_not_retried(self):
+
+        def reply(comment_id, text):
+
+            if comment_id == "c5":
+                raise FakeAPIException("THREAD_LOCKED", "This thread is locked.")
+
+            self.reddit.replies.append((comment_id, text))
+
+        self.reddit.reply = reply
+        rejected_ids = list()
+
+        replied_items, failed_items = self.make_scheduler(
+            on_rejected=lambda comment: rejected_ids.append(comment.id)).run(self.mentions)
+
+        self.assertEqual(len(replied_items), 99)
+        self.assertEqual([comment.id for comment in failed_items], ["c5"])
+        self.assertEqual(rejected_ids, ["c5"])
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_transient_errors_are_retried(self):
+
+        errors = [ConnectionError("Connection reset."), ConnectionError("Connection reset.")]
+
+        def reply(comment_id, text):
+
+            if comment_id == "c0" and errors:
+                raise errors.pop()
+
+            self.reddit.replies.append((comment_id, text))
+
+        self.reddit.reply = reply
+
+        replied_items, failed_items = self.make_scheduler(backoff=5).run(self.mentions)
+
+        self.assertEqual(len(replied_items), 100)
+        self.assertEqual(self.clock.sleeps, [5, 10])
+
+    def test_unknown_errors_are_not_retried(self):
+
+        def reply(comment_id, text):
+
+            if comment_id == "c0":
+                raise ValueError("Unexpected.")
+
+            self.reddit.replies.append((comment_id, text))
+
+        self.reddit.reply = reply
+        rejected_ids = list()
+
+        replied_items, failed_items = self.make_scheduler(
+            on_rejected=lambda comment: rejected_ids.append(comment.id)).run(self.mentions)
+
+        # It could work in the next run, so it isn't rejected.
+        self.assertEqual([comment.id for comment in failed_items], ["c0"])
+        self.assertEqual(rejected_ids, [])
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_max_run_time_leaves_the_rest_for_the_next_run(self):
+
+        scheduler = self.make_scheduler(get_limits=lambda: self.reddit.limits, max_run_time=50)
+        replied_items, failed_items = scheduler.run(self.mentions)
+
+        # The first window is used and waiting for the next one would take too long.
+        self.assertEqual(len(replied_items), 12)
+        self.assertEqual(failed_items, self.mentions[12:])
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_max_run_time_covers_the_error_delays(self):
+
+        self.reddit.ratelimit_message = "Take a break for 5 minutes before trying again."
+
+        replied_items, failed_items = self.make_scheduler(max_run_time=50).run(self.mentions)
+
+        self.assertEqual(len(replied_items), 12)
+        self.assertEqual(len(failed_items), 88)
+        self.assertEqual(self.clock.sleeps, [])
+
+
+if __name__ == "__main__":
+
+    unittest.main()
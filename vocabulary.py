@@ -0,0 +1,83 @@
+"""
+Maps words to integer ids so training and generation work with small tuples of
+integers instead of building a new string for every prefix.
+"""
+
+
+class Vocabulary:
+    """Assigns an id to each unique word, in the order they are first seen.
+
+    Every occurrence of a word shares the same string object, so a model built from
+    the vocabulary keeps a single copy of each word in memory and in the pickle.
+    """
+
+    def __init__(self):
+
+        self.words = list()
+        self.ids = dict()
+
+    def __len__(self):
+
+        return len(self.words)
+
+    def intern(self, word):
+        """Returns the id of a word, adding it if it is new.
+
+        Parameters
+        ----------
+        word : str
+            The word.
+
+        Returns
+        -------
+        int
+            The id of the word.
+
+        """
+
+        word_id = self.ids.get(word)
+
+        if word_id is None:
+            word_id = len(self.words)
+            self.ids[word] = word_id
+            self.words.append(word)
+
+        return word_id
+
+    def encode(self, words_list):
+        """Converts a list of words into their ids, adding the new ones.
+
+        Parameters
+        ----------
+        words_list : list
+            The words.
+
+        Returns
+        -------
+        list
+            The ids in the same order.
+
+        """
+
+        ids = self.ids
+
+        # We only call intern() for the words we haven't seen yet.
+        return [ids[word] if word in ids else self.intern(word) for word in words_list]
+
+    def decode(self, word_ids):
+        """Joins the words of the given ids into a string.
+
+        Parameters
+        ----------
+        word_ids : iterable
+            The ids of the words.
+
+        Returns
+        -------
+        str
+            The words separated by spaces.
+
+        """
+
+        return " ".join(map(self.words.__getitem__, word_ids))
+